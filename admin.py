@@ -0,0 +1,105 @@
+import hmac
+import os
+from flask import Blueprint, Response, abort, current_app, jsonify, request, send_from_directory
+from profiling import list_profiles
+from metrics import render_metrics
+
+
+admin = Blueprint('admin', __name__)
+
+@admin.before_request
+def require_admin_token():
+    """
+    Reject admin requests without a valid ``X-Admin-Token`` header. The admin
+    endpoints are disabled entirely while no ``ADMIN_TOKEN`` is configured.
+    """
+    expected = current_app.config.get('ADMIN_TOKEN')
+    token = request.headers.get('X-Admin-Token', '')
+    if not expected or not hmac.compare_digest(token.encode(), expected.encode()):
+        abort(403)
+
+
+@admin.route('/profiling', methods=['GET', 'POST'])
+def profiling_toggle():
+    """
+    Show or change the profiling toggle of this worker.
+
+    JSON Body (POST):
+        enabled (bool): Whether to profile every request.
+        seconds (int): How long to keep profiling on, defaults to 300.
+
+    Returns:
+        JSON with the current toggle state and sample rate.
+    """
+    state = current_app.extensions['profiling']
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        if body.get('enabled'):
+            state.enable(int(body.get('seconds', 300)))
+        else:
+            state.disable()
+    return jsonify({
+        "enabled": state.enabled,
+        "sample_rate": current_app.config['PROFILE_SAMPLE_RATE'],
+    })
+
+
+@admin.route('/profiles', methods=['GET'])
+def get_profiles():
+    """
+    List recent request profiles, newest first.
+
+    Query Args:
+        endpoint (str): Only list profiles of this endpoint.
+        limit (int): Maximum number of profiles, defaults to 50.
+
+    Returns:
+        JSON list of profiles with their downloadable files.
+    """
+    return jsonify(list_profiles(current_app.config['PROFILE_DIR'],
+                                 endpoint=request.args.get('endpoint'),
+                                 limit=request.args.get('limit', 50, type=int)))
+
+
+@admin.route('/profiles/<path:filename>', methods=['GET'])
+def download_profile(filename):
+    """
+    Download a ``.folded`` stack file or ``.alloc.txt`` report.
+    """
+    if os.path.basename(filename) != filename:
+        abort(404)
+    return send_from_directory(current_app.config['PROFILE_DIR'], filename,
+                               as_attachment=True, mimetype='text/plain')
+
+
+@admin.route('/backup', methods=['GET', 'POST'])
+def backup():
+    """
+    Start an online backup of the database or show the status of the last one.
+
+    JSON Body (POST):
+        snapshot (bool): Write a compacted, read-only snapshot instead.
+
+    Returns:
+        202 with the target path when a backup was started, 409 if one is
+        already running, or the backup status for GET. 501 if the storage
+        backend has no online backup.
+    """
+    runner = current_app.extensions.get('backup')
+    if runner is None:
+        return jsonify({"error": "Online backups are not supported by the storage backend"}), 501
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        target = runner.start(snapshot=bool(body.get('snapshot')))
+        if target is None:
+            return jsonify({"error": "A backup is already running"}), 409
+        return jsonify({"target": target}), 202
+    return jsonify(runner.get_status())
+
+
+@admin.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Expose this worker's metrics in the Prometheus text format.
+    """
+    return Response(render_metrics(), mimetype='text/plain')
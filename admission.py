@@ -0,0 +1,198 @@
+"""
+Admission control for expensive routes.
+
+Token buckets limit how often a client or a user may hit a route, and a
+global concurrency cap bounds how many requests may wait on OMDb at once.
+Both are kept in a small local SQLite database, so every worker process of
+the app shares the same limits. Requests over a limit are rejected right away
+with 429 or 503 and a ``Retry-After`` header, leaving worker threads free for
+cheap read routes.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, request
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+
+
+class LimiterStore:
+    """
+    Token buckets and concurrency leases persisted in a SQLite file.
+
+    Every check runs in a short ``BEGIN IMMEDIATE`` transaction, which makes
+    it atomic across threads and processes.
+    """
+
+    def __init__(self, db_path, clock=time.time):
+        self.db_path = db_path
+        self.clock = clock
+        self.local = threading.local()
+
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=1, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute("CREATE TABLE IF NOT EXISTS buckets ("
+                               "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS leases ("
+                               "id TEXT PRIMARY KEY, name TEXT NOT NULL, expires_at REAL NOT NULL)")
+            self.local.connection = connection
+        return connection
+
+
+    @contextmanager
+    def transaction(self):
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+
+    def take_token(self, key, limit, period):
+        """
+        Takes one token from the bucket ``key``, which holds up to ``limit``
+        tokens and refills completely every ``period`` seconds.
+
+        Returns:
+            float: 0 if the request is allowed, otherwise the number of
+            seconds until a token is available.
+        """
+        rate = limit / period
+        now = self.clock()
+        with self.transaction() as connection:
+            row = connection.execute(
+                "SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = limit if row is None else min(limit, row[0] + (now - row[1]) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            connection.execute(
+                "INSERT INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, "
+                "updated_at = excluded.updated_at", (key, tokens, now))
+        return wait
+
+
+    def acquire_slot(self, name, limit, lease_seconds):
+        """
+        Acquires one of ``limit`` concurrency slots called ``name``. Slots of
+        crashed workers are reclaimed once their lease expires.
+
+        Returns:
+            str: Lease id to pass to ``release_slot``.
+            None: If all slots are taken.
+        """
+        now = self.clock()
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM leases WHERE expires_at < ?", (now,))
+            (active,) = connection.execute(
+                "SELECT COUNT(*) FROM leases WHERE name = ?", (name,)).fetchone()
+            if active >= limit:
+                return None
+            lease_id = uuid.uuid4().hex
+            connection.execute("INSERT INTO leases (id, name, expires_at) VALUES (?, ?, ?)",
+                               (lease_id, name, now + lease_seconds))
+        return lease_id
+
+
+    def release_slot(self, lease_id):
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM leases WHERE id = ?", (lease_id,))
+
+
+def init_admission_control(app, db_path):
+    """
+    Sets up the shared limiter store.
+
+    Config:
+        RATE_LIMITS (dict): Per route name, ``per_client`` and/or ``per_user``
+            limits as ``(requests, seconds)`` tuples.
+        OMDB_MAX_CONCURRENCY (int): Requests allowed to call OMDb at once.
+        OMDB_LEASE_SECONDS (int): Time after which a held OMDb slot is
+            considered abandoned.
+        OMDB_RETRY_AFTER (int): ``Retry-After`` sent when OMDb is saturated.
+    """
+    app.config.setdefault('RATE_LIMITS', {})
+    app.config.setdefault('OMDB_MAX_CONCURRENCY', 2)
+    app.config.setdefault('OMDB_LEASE_SECONDS', 30)
+    app.config.setdefault('OMDB_RETRY_AFTER', 5)
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    app.extensions['admission'] = LimiterStore(db_path)
+
+
+def check_limit(store, key, limit):
+    if not limit:
+        return
+    count, period = limit
+    try:
+        wait = store.take_token(key, count, period)
+    except sqlite3.Error as e:
+        # Never turn a limiter problem into an outage
+        current_app.logger.error(f"Rate limiter unavailable: {e}")
+        return
+    if wait:
+        raise TooManyRequests(retry_after=math.ceil(wait))
+
+
+def rate_limited(route_name, methods=('POST',)):
+    """
+    Applies the ``RATE_LIMITS[route_name]`` token buckets to a view, keyed by
+    client address and, for routes with a ``user_id`` argument, by user.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            limits = current_app.config['RATE_LIMITS'].get(route_name)
+            if limits and request.method in methods:
+                store = current_app.extensions['admission']
+                check_limit(store, f"{route_name}:client:{request.remote_addr}",
+                            limits.get('per_client'))
+                if 'user_id' in kwargs:
+                    check_limit(store, f"{route_name}:user:{kwargs['user_id']}",
+                                limits.get('per_user'))
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def omdb_slot():
+    """
+    Holds one of the global OMDb concurrency slots for the duration of the
+    block, or raises 503 right away if they are all taken.
+    """
+    store = current_app.extensions['admission']
+    config = current_app.config
+    try:
+        lease_id = store.acquire_slot('omdb', config['OMDB_MAX_CONCURRENCY'],
+                                      config['OMDB_LEASE_SECONDS'])
+    except sqlite3.Error as e:
+        current_app.logger.error(f"Concurrency limiter unavailable: {e}")
+        yield
+        return
+    if lease_id is None:
+        raise ServiceUnavailable(retry_after=config['OMDB_RETRY_AFTER'])
+    try:
+        yield
+    finally:
+        try:
+            store.release_slot(lease_id)
+        except sqlite3.Error as e:
+            # The lease expires on its own after OMDB_LEASE_SECONDS
+            current_app.logger.error(f"Could not release OMDb slot: {e}")
@@ -1,4 +1,6 @@
-from flask import Blueprint, jsonify
+import json
+import time
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from app_setup import app, data_manager
 
 
@@ -12,13 +14,9 @@ def get_users():
     Returns:
         Rendered HTML template displaying a list of all users.
     """
-    try:
-        users = data_manager.get_all_users()
-        users_list = [user.to_dict() for user in users]
-    except Exception as e:
-        app.logger.error(f"Error fetching users: {e}")
-        users_list = []
-    return jsonify(users_list)
+    # Errors go to the app's error handlers; an empty list must mean no users
+    users = data_manager.get_all_user_rows()
+    return jsonify([user._asdict() for user in users])
 
 
 
@@ -34,10 +32,107 @@ def get_user_movies(user_id):
         Rendered HTML template displaying the user's movies.
     """
     # check_user_exist(user_id)
-    try:
-        movies = data_manager.get_user_movies(user_id)
-        movies_list = [movie.to_dict() for movie in movies]
-    except Exception as e:
-        app.logger.error(f"Error fetching users: {e}")
-        movies_list = []
-    return jsonify(movies_list)
\ No newline at end of file
+    # Read the change sequence first so clients can continue with /changes from it
+    change_seq = data_manager.get_latest_change_seq(user_id)
+    # No fallback to an empty list here: clients replace their copy with this
+    # snapshot and only apply changes after X-Change-Seq from then on
+    movies = data_manager.get_user_movie_rows(user_id)
+    response = jsonify([movie._asdict() for movie in movies])
+    response.headers['X-Change-Seq'] = str(change_seq)
+    return response
+
+
+def change_to_dict(change):
+    """
+    Converts a library change row into its JSON representation.
+    """
+    movie = None
+    if change.op != 'delete' and change.title is not None:
+        movie = {
+            "id": change.movie_id,
+            "title": change.title,
+            "director": change.director,
+            "year": change.year,
+            "rating": change.rating,
+        }
+    return {"seq": change.seq, "op": change.op, "movie_id": change.movie_id, "movie": movie}
+
+
+def change_log_compacted(user_id):
+    """
+    Tells a client that the change log no longer reaches back to its
+    sequence number, so it must reload the full library.
+    """
+    return jsonify({"error": "Change log compacted, reload the full library",
+                    "latest_seq": data_manager.get_latest_change_seq(user_id)}), 410
+
+
+@api.route("/users/<int:user_id>/changes")
+def get_user_changes(user_id):
+    """
+    Return the changes to a user's library since a sequence number.
+
+    Query Args:
+        since (int): Last sequence number the client has applied.
+        limit (int): Maximum number of changes to return.
+
+    Returns:
+        JSON with the ``changes``, the ``latest_seq`` to pass as ``since`` next
+        time and whether there are more changes to fetch. Responds with 410 if
+        the log no longer reaches back to ``since``; the client must then
+        reload ``/users/<id>/movies``.
+    """
+    since = request.args.get('since', 0, type=int)
+    limit = max(1, min(request.args.get('limit', 500, type=int), 1000))
+
+    if since < data_manager.get_change_horizon(user_id):
+        return change_log_compacted(user_id)
+
+    changes = data_manager.get_library_changes(user_id, since, limit)
+    return jsonify({
+        "changes": [change_to_dict(change) for change in changes],
+        "latest_seq": changes[-1].seq if changes else since,
+        "has_more": len(changes) == limit,
+    })
+
+
+@api.route("/users/<int:user_id>/changes/stream")
+def stream_user_changes(user_id):
+    """
+    Push a user's library changes as server-sent events.
+
+    Resumes after the ``Last-Event-ID`` header (or ``since`` query argument)
+    and sends a comment line as keep-alive while nothing changes.
+
+    Returns:
+        A ``text/event-stream`` response, or 410 like ``/changes`` if the log
+        no longer reaches back to the resume point.
+    """
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', 0, type=int)
+    if since < data_manager.get_change_horizon(user_id):
+        return change_log_compacted(user_id)
+    poll_interval = app.config.get('CHANGES_POLL_INTERVAL', 2)
+    keep_alive_interval = app.config.get('CHANGES_KEEP_ALIVE_INTERVAL', 15)
+
+    @stream_with_context
+    def events():
+        last_seq = since
+        last_sent = time.monotonic()
+        yield f"retry: {int(poll_interval * 1000)}\n\n"
+        while True:
+            changes = data_manager.get_library_changes(user_id, last_seq)
+            for change in changes:
+                yield (f"id: {change.seq}\nevent: change\n"
+                       f"data: {json.dumps(change_to_dict(change))}\n\n")
+                last_seq = change.seq
+            if changes:
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= keep_alive_interval:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            data_manager.wait_for_changes(poll_interval)
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
\ No newline at end of file
@@ -8,11 +8,16 @@ It integrates with an SQLite database for persistence and the OMDB API for fetch
 
 import omdbapi
 from flask import render_template, request, redirect, url_for, flash, abort
-from app_setup import app, data_manager
+from werkzeug.exceptions import HTTPException, ServiceUnavailable
+from app_setup import app, data_manager, movie_catalog
 from api import api  # Importing the API blueprint
-from datamanager.sqlite_data_manager import User, Movie, UserMovieLibrary
+from admin import admin  # Importing the admin blueprint
+from background_jobs import start_jobs_with_first_request
+from admission import rate_limited, omdb_slot
+from datamanager.sqlite_data_manager import User, Movie, UserMovieLibrary, PoolTimeoutError
 
 app.register_blueprint(api, url_prefix='/api')  # Registering the blueprint
+app.register_blueprint(admin, url_prefix='/admin')
 
 @app.route('/')
 def home():
@@ -35,6 +40,8 @@ def list_users():
     """
     try:
         users = data_manager.get_all_users()
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         app.logger.error(f"Error fetching users: {e}")
         users = []
@@ -54,7 +61,9 @@ def user_profile(user_id):
     """
     check_user_exist(user_id)
     try:
-        movies = data_manager.get_user_movies(user_id)
+        movies = data_manager.get_user_movie_cards(user_id)
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         app.logger.error(f"Error fetching users: {e}")
         movies = []
@@ -63,6 +72,7 @@ def user_profile(user_id):
 
 
 @app.route('/add_user', methods=['GET', 'POST'])
+@rate_limited('add_user')
 def add_user():
     """
     Add a new user to the system.
@@ -83,6 +93,8 @@ def add_user():
             user = User(name=user_name.strip())
             data_manager.add_user(user)
             app.logger.info("User added successfully", "success")
+        except PoolTimeoutError:
+            raise
         except Exception as e:
             app.logger.error(f"Error adding user: {e}")
         return redirect(url_for('list_users'))
@@ -90,6 +102,7 @@ def add_user():
 
 
 @app.route("/users/<int:user_id>/add_movie", methods=['GET', 'POST'])
+@rate_limited('add_movie')
 def add_movie(user_id):
     """
     Add a new movie to a user's collection.
@@ -108,8 +121,32 @@ def add_movie(user_id):
 
     if request.method == "POST":
         movie_title = request.form.get('title')
+        # Optional, tells remakes apart in the catalog and on OMDb
+        year = (request.form.get('year') or '').strip() or None
         try:
-            omdb_movie = omdbapi.get_movie_info(movie_title)
+            omdb_movie = None
+            catalog_id = request.form.get('catalog_id', type=int)
+            if catalog_id:
+                # A picked suggestion, resolve it exactly
+                omdb_movie = movie_catalog.get(catalog_id)
+            elif not request.form.get('skip_catalog'):
+                omdb_movie = movie_catalog.lookup(movie_title,
+                                                  min_score=app.config['CATALOG_ACCEPT_SCORE'],
+                                                  year=year)
+                if not omdb_movie:
+                    # Offer close local matches before spending an OMDB request
+                    suggestions = movie_catalog.search(movie_title,
+                                                       min_score=app.config['CATALOG_SUGGEST_SCORE'],
+                                                       year=year)
+                    if suggestions:
+                        return render_template('add_movie.html', user_id=user_id, title=movie_title,
+                                               year=year,
+                                               suggestions=[movie for score, movie in suggestions])
+
+            if not omdb_movie:
+                with omdb_slot():
+                    omdb_movie = omdbapi.get_movie_info(movie_title, year)
+                movie_catalog.add(omdb_movie)
             if not omdb_movie:
                 app.logger.error("No movie found or an error occurred", "error")
                 return render_template('add_movie.html',
@@ -127,6 +164,8 @@ def add_movie(user_id):
                 relationship = UserMovieLibrary(user_id=user_id, movie_id=movie.id)
                 data_manager.add_user_movie_relationship(relationship)
 
+        except (HTTPException, PoolTimeoutError):
+            raise
         except Exception as e:
             app.logger.error(f"Error adding movie for user {user_id}: {e}")
         return render_template('notification.html',
@@ -346,6 +385,59 @@ def bad_request(e):
     return render_template('400.html'), 400
 
 
+# Handle 429 Too Many Requests
+@app.errorhandler(429)
+def too_many_requests(e):
+    """
+    Handle 429 errors (Rate Limit Exceeded).
+
+    Args:
+        e (Exception): The exception object.
+
+    Returns:
+        Rendered HTML template for 429 error, status code 429 and Retry-After.
+    """
+    app.logger.warning(f"429 Error: {request.path} from {request.remote_addr}")
+    return render_template('429.html'), 429, retry_after_header(e)
+
+
+# Handle 503 Service Unavailable
+@app.errorhandler(503)
+def service_unavailable(e):
+    """
+    Handle 503 errors (Service Unavailable).
+
+    Args:
+        e (Exception): The exception object.
+
+    Returns:
+        Rendered HTML template for 503 error, status code 503 and Retry-After.
+    """
+    app.logger.warning(f"503 Error: {e}")
+    return render_template('503.html'), 503, retry_after_header(e)
+
+
+# Handle an exhausted connection pool
+@app.errorhandler(PoolTimeoutError)
+def database_busy(e):
+    """
+    Handle connection pool checkout timeouts as a 503 instead of a 500.
+
+    Args:
+        e (Exception): The exception object.
+
+    Returns:
+        Rendered HTML template for 503 error, status code 503 and Retry-After.
+    """
+    app.logger.warning(f"Connection pool exhausted on {request.path}: {e}")
+    return service_unavailable(ServiceUnavailable(retry_after=app.config['DB_POOL_RETRY_AFTER']))
+
+
+def retry_after_header(e):
+    retry_after = getattr(e, 'retry_after', None)
+    return {'Retry-After': str(retry_after)} if retry_after is not None else {}
+
+
 # Handle Generic Exceptions (Optional)
 @app.errorhandler(Exception)
 def handle_exception(e):
@@ -365,4 +457,8 @@ def handle_exception(e):
 
 
 if __name__ == '__main__':
+    # The development server always runs the jobs; they start with the first
+    # request, so only the reloader's serving child process runs them
+    if not app.config['RUN_BACKGROUND_JOBS']:
+        start_jobs_with_first_request(app)
     app.run(port=5001, debug=True)
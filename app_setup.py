@@ -1,24 +1,105 @@
 import os
+from datetime import timedelta
 from flask import Flask
-from datamanager.sqlite_data_manager import SQLiteDataManager
-
-# Define paths for database setup
-MAIN_FOLDER_PATH = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = "./data"
-DB_NAME = "moviwebapp.sqlite"
-DB_PATH = os.path.join(MAIN_FOLDER_PATH, DB_PATH, DB_NAME)
+from datamanager.sqlite_data_manager import SQLiteDataManager, utcnow
+from datamanager.sharded_sqlite_data_manager import ShardedSQLiteDataManager, CATALOG_FILE_NAME
+from compression import init_compression
+from static_assets import init_static_assets
+from movie_catalog import MovieCatalog
+from refresh_scheduler import init_refresh_scheduler
+from background_jobs import register_job, start_jobs_with_first_request
+from admission import init_admission_control
+from profiling import init_profiling
+from backup import BackupRunner
+from storage_maintenance import init_storage_maintenance
+from settings import (DB_PATH, SHARD_COUNT, SHARD_DIR, CATALOG_PATH, LIMITER_PATH, PROFILE_DIR,
+                      BACKUP_DIR)
 
 # Initialize Flask app
 app = Flask(__name__)
-data_manager = SQLiteDataManager(DB_PATH)  # Use the appropriate path to your Database
+if SHARD_COUNT:
+    # Spread writers over several files, see datamanager/sharded_sqlite_data_manager.py.
+    # The app's own session, used for the refresh budget, works on the catalog
+    data_manager = ShardedSQLiteDataManager(SHARD_DIR, SHARD_COUNT)
+    database_path = os.path.join(SHARD_DIR, CATALOG_FILE_NAME)
+else:
+    data_manager = SQLiteDataManager(DB_PATH)  # Use the appropriate path to your Database
+    database_path = DB_PATH
+movie_catalog = MovieCatalog(CATALOG_PATH)  # Local movie lookup before falling back to OMDB
 
 # Secret key for session management and flash messages
 app.secret_key = 'your_secret_key'
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{DB_PATH}"
+app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{database_path}"
+# SQLite runs one write at a time, so a couple of writer connections suffice;
+# reads get their own pool below. The background jobs share this pool with
+# write requests, so allow some overflow and give up quickly when it is
+# exhausted: the data manager re-raises the pool timeout and app.py answers 503
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': 2, 'max_overflow': 4, 'pool_timeout': 5}
+app.config['DB_POOL_RETRY_AFTER'] = 5
 data_manager.db.init_app(app)
 
+# Token for the /admin endpoints and X-Profile header, admin is disabled without it
+app.config['ADMIN_TOKEN'] = os.getenv("ADMIN_TOKEN")
+
+# Opt-in request profiling, see profiling.py
+app.config['PROFILE_SAMPLE_RATE'] = 0.0
+init_profiling(app, PROFILE_DIR)
+
+# Online backups through /admin/backup, see backup.py. They copy a single
+# file, so the sharded backend has none
+if not SHARD_COUNT:
+    app.extensions['backup'] = BackupRunner(DB_PATH, BACKUP_DIR)
+
+# Compress responses and serve fingerprinted, precompressed static files
+app.config['COMPRESS_MIN_SIZE'] = 500
+init_compression(app)
+init_static_assets(app)
+
+# Limit expensive routes so an add storm cannot starve the read routes
+app.config['RATE_LIMITS'] = {
+    'add_movie': {'per_client': (20, 60), 'per_user': (10, 60)},  # (requests, seconds)
+    'add_user': {'per_client': (10, 60)},
+}
+app.config['OMDB_MAX_CONCURRENCY'] = 2
+init_admission_control(app, LIMITER_PATH)
+
+# Similarity needed to add a movie from the local catalog without asking
+app.config['CATALOG_ACCEPT_SCORE'] = 0.6
+app.config['CATALOG_SUGGEST_SCORE'] = 0.3
+
 # Create database if it doesn't exist
-if not os.path.exists(DB_PATH):
+if not SHARD_COUNT and not os.path.exists(DB_PATH):
     with app.app_context():
+        # Cheap while there are no tables yet; existing databases are converted
+        # offline with `python storage_maintenance.py --enable-incremental-vacuum`
+        data_manager.enable_incremental_vacuum()
         data_manager.db.create_all()
-        print("New DB Created")
\ No newline at end of file
+        print("New DB Created")
+
+# Bring older databases up to date with the current models
+with app.app_context():
+    data_manager.migrate_schema()
+
+# Serve reads from a read-only connection pool sized to the CPU count, giving up
+# as quickly as the writer pool when it is exhausted
+data_manager.init_read_routing(app)
+
+# Keep movie ratings and posters fresh without touching the request path
+app.config['OMDB_HOURLY_BUDGET'] = 50
+app.config['OMDB_DAILY_BUDGET'] = 500
+init_refresh_scheduler(app, data_manager)
+
+# Drop superseded library change log entries once clients had time to sync
+app.config['CHANGE_LOG_RETENTION_DAYS'] = 30
+register_job(app, 'change-log-compaction', 60 * 60,
+             lambda: data_manager.compact_library_changes(
+                 utcnow() - timedelta(days=app.config['CHANGE_LOG_RETENTION_DAYS'])))
+
+# Delete movies no library uses anymore and shrink the file while idle
+init_storage_maintenance(app, data_manager)
+
+# Under a WSGI server the jobs above only run with MOVIEWEB_RUN_JOBS=1. Set it
+# for a single worker or instance, the jobs are not meant to run twice
+app.config['RUN_BACKGROUND_JOBS'] = os.getenv("MOVIEWEB_RUN_JOBS") == "1"
+if app.config['RUN_BACKGROUND_JOBS']:
+    start_jobs_with_first_request(app)
@@ -0,0 +1,130 @@
+"""
+Periodic background jobs.
+
+Jobs run in daemon threads inside an application context and never on the
+request path. They are registered at setup time and only start in a process
+that opts in: ``python app.py`` always does, WSGI servers do when
+``MOVIEWEB_RUN_JOBS=1`` (see ``app_setup.py``). Jobs start with the first
+request the process serves, so a reloader's file watcher process never runs
+them, and test clients or extra workers importing the app do not either.
+"""
+
+import threading
+import time
+
+from flask import g, request
+
+
+class BackgroundJob(threading.Thread):
+    """
+    Calls ``func()`` every ``interval`` seconds until stopped.
+    """
+
+    def __init__(self, app, name, interval, func):
+        super().__init__(name=name, daemon=True)
+        self.app = app
+        self.interval = interval
+        self.func = func
+        self.stopped = threading.Event()
+
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.run_once()
+
+
+    def run_once(self):
+        with self.app.app_context():
+            try:
+                self.func()
+            except Exception as e:
+                self.app.logger.error(f"Background job {self.name} failed: {e}")
+
+
+    def stop(self):
+        self.stopped.set()
+
+
+def register_job(app, name, interval, func):
+    """
+    Registers a periodic job on the app. It only runs once
+    ``start_background_jobs`` is called.
+    """
+    jobs = app.extensions.setdefault('background_jobs', {})
+    jobs[name] = BackgroundJob(app, name, interval, func)
+    return jobs[name]
+
+
+def start_background_jobs(app):
+    for job in app.extensions.get('background_jobs', {}).values():
+        if not job.is_alive():
+            job.start()
+            app.logger.info(f"Started background job {job.name} (every {job.interval}s)")
+
+
+def start_jobs_with_first_request(app):
+    """
+    Starts the app's background jobs when this process serves its first
+    request. A process that never serves, like the reloader's watcher, never
+    starts them.
+    """
+    lock = threading.Lock()
+
+    def start_once():
+        if app.extensions.get('background_jobs_started'):
+            return
+        with lock:
+            if not app.extensions.get('background_jobs_started'):
+                app.extensions['background_jobs_started'] = True
+                start_background_jobs(app)
+
+    app.before_request(start_once)
+
+
+def stop_background_jobs(app):
+    for job in app.extensions.get('background_jobs', {}).values():
+        job.stop()
+
+
+class ActivityTracker:
+    """
+    Tracks requests in flight and the time of the last request, so jobs that
+    compete with requests for the database can wait for idle periods.
+    Long-lived endpoints such as event streams can be left out.
+    """
+
+    def __init__(self, ignored_endpoints=()):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.last_request = time.monotonic()
+        self.ignored_endpoints = set(ignored_endpoints)
+
+
+    def request_started(self):
+        if request.endpoint in self.ignored_endpoints:
+            return
+        g.activity_tracked = True
+        with self.lock:
+            self.in_flight += 1
+            self.last_request = time.monotonic()
+
+
+    def request_finished(self, exception=None):
+        if not g.pop('activity_tracked', False):
+            return
+        with self.lock:
+            self.in_flight -= 1
+            self.last_request = time.monotonic()
+
+
+    def is_idle(self, quiet_seconds):
+        with self.lock:
+            return self.in_flight == 0 and time.monotonic() - self.last_request >= quiet_seconds
+
+
+def track_activity(app, ignored_endpoints=()):
+    tracker = ActivityTracker(ignored_endpoints)
+    app.before_request(tracker.request_started)
+    app.teardown_request(tracker.request_finished)
+    app.extensions['activity'] = tracker
+    return tracker
@@ -0,0 +1,208 @@
+"""
+Online backup of the SQLite database.
+
+Uses SQLite's online backup API to copy the database a few pages at a time,
+sleeping between steps so writers are never blocked for long. Optionally the
+copy is turned into a compacted, read-only snapshot for analytics or for
+seeding a new node. Progress and duration are reported as metrics.
+
+Run a backup from the command line with:
+
+    python backup.py [TARGET] [--snapshot]
+"""
+
+import argparse
+import os
+import sqlite3
+import stat
+import threading
+import time
+from datetime import datetime
+
+from metrics import get_metric, inc_counter, set_gauge
+
+DEFAULT_PAGES_PER_STEP = 256
+DEFAULT_STEP_SLEEP = 0.01
+DEFAULT_MAX_SECONDS = 15 * 60
+
+
+class BackupTimeout(Exception):
+    pass
+
+
+class BackupProgress:
+    """
+    Progress callback for ``sqlite3.Connection.backup``.
+
+    SQLite starts the copy over whenever another connection writes to the
+    source between steps, so under steady writes a backup may never finish.
+    Restarts are counted and the backup is aborted after ``max_seconds``.
+    """
+
+    def __init__(self, max_seconds):
+        self.deadline = time.monotonic() + max_seconds
+        self.max_seconds = max_seconds
+        self.last_remaining = None
+        self.restarts = 0
+
+
+    def __call__(self, status, remaining, total):
+        # Without a restart every step leaves fewer pages to copy
+        if self.last_remaining is not None and remaining >= self.last_remaining:
+            self.restarts += 1
+            inc_counter('backup_restarts_total',
+                        description="Backups started over because the source was written to")
+        self.last_remaining = remaining
+        report_progress(status, remaining, total)
+        set_gauge('backup_restarts', self.restarts, "Restarts of the current backup")
+        if remaining and time.monotonic() > self.deadline:
+            # Raising from the callback makes sqlite3 abort the backup
+            raise BackupTimeout(f"Backup did not finish within {self.max_seconds}s "
+                                f"({self.restarts} restarts)")
+
+
+def default_backup_path(backup_dir, snapshot=False):
+    kind = 'snapshot' if snapshot else 'backup'
+    return os.path.join(backup_dir, f"moviwebapp-{kind}-{datetime.now():%Y%m%d-%H%M%S}.sqlite")
+
+
+def report_progress(status, remaining, total):
+    set_gauge('backup_pages_total', total, "Pages in the database being backed up")
+    set_gauge('backup_pages_remaining', remaining, "Pages still to copy")
+    set_gauge('backup_progress_ratio', round(1 - remaining / total, 4) if total else 1,
+              "Fraction of the current backup completed")
+
+
+def backup_database(source_path, target_path, snapshot=False,
+                    pages=DEFAULT_PAGES_PER_STEP, sleep=DEFAULT_STEP_SLEEP,
+                    max_seconds=DEFAULT_MAX_SECONDS):
+    """
+    Copies a live SQLite database to ``target_path``.
+
+    The copy is written to a ``.partial`` file first and only renamed into
+    place once it is complete, so a target path never holds half a backup.
+
+    Args:
+        source_path (str): Database to back up.
+        target_path (str): Where to write the copy.
+        snapshot (bool): VACUUM the copy, switch it to rollback journaling
+            and make the file read-only.
+        pages (int): Pages copied per step; locks are released between steps.
+        sleep (float): Seconds to wait before retrying a step that found
+            the source locked.
+        max_seconds (float): Give up with ``BackupTimeout`` if the copy has
+            not finished by then, e.g. because writes keep restarting it.
+
+    Returns:
+        dict: The ``target`` path, its ``size`` in bytes and the ``duration``
+        in seconds.
+    """
+    os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
+    partial_path = target_path + '.partial'
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+
+    started = time.perf_counter()
+    set_gauge('backup_in_progress', 1, "Whether a backup is running")
+    try:
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(partial_path)
+        try:
+            source.backup(target, pages=pages, progress=BackupProgress(max_seconds), sleep=sleep)
+            if snapshot:
+                target.execute("VACUUM")
+                target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+            source.close()
+
+        if snapshot:
+            os.chmod(partial_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.replace(partial_path, target_path)
+    except Exception as e:
+        inc_counter('backup_failures_total', description="Backups that failed")
+        if isinstance(e, BackupTimeout):
+            inc_counter('backup_timeouts_total', description="Backups aborted after max_seconds")
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    finally:
+        set_gauge('backup_in_progress', 0, "Whether a backup is running")
+
+    duration = time.perf_counter() - started
+    size = os.path.getsize(target_path)
+    set_gauge('backup_last_duration_seconds', round(duration, 3), "Duration of the last backup")
+    set_gauge('backup_last_size_bytes', size, "Size of the last backup file")
+    set_gauge('backup_last_success_timestamp', int(time.time()), "Unix time of the last backup")
+    inc_counter('backups_total', description="Backups completed")
+    return {'target': target_path, 'size': size, 'duration': duration}
+
+
+class BackupRunner:
+    """
+    Runs at most one backup at a time in a background thread, for the admin
+    endpoint.
+    """
+
+    def __init__(self, source_path, backup_dir):
+        self.source_path = source_path
+        self.backup_dir = backup_dir
+        self.lock = threading.Lock()
+        self.thread = None
+        self.status = {'running': False}
+
+
+    def start(self, snapshot=False):
+        """
+        Returns:
+            str: Path the backup is written to.
+            None: If a backup is already running.
+        """
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return None
+            target_path = default_backup_path(self.backup_dir, snapshot)
+            self.status = {'running': True, 'target': target_path, 'snapshot': snapshot,
+                           'started_at': datetime.now().isoformat()}
+            self.thread = threading.Thread(target=self.run, args=(target_path, snapshot),
+                                           name='backup', daemon=True)
+            self.thread.start()
+            return target_path
+
+
+    def run(self, target_path, snapshot):
+        try:
+            result = backup_database(self.source_path, target_path, snapshot=snapshot)
+            update = {'size': result['size'], 'duration': result['duration']}
+        except Exception as e:
+            update = {'error': str(e)}
+        with self.lock:
+            self.status.update(update, running=False, finished_at=datetime.now().isoformat())
+
+
+    def get_status(self):
+        with self.lock:
+            status = dict(self.status)
+        if status['running']:
+            status['progress'] = get_metric('backup_progress_ratio')
+        return status
+
+
+if __name__ == '__main__':
+    from settings import DB_PATH, BACKUP_DIR
+
+    parser = argparse.ArgumentParser(description="Back up the MovieWeb database while it is in use")
+    parser.add_argument('target', nargs='?', help="backup file, defaults to a dated file in data/backups")
+    parser.add_argument('--snapshot', action='store_true',
+                        help="write a compacted, read-only snapshot")
+    parser.add_argument('--pages', type=int, default=DEFAULT_PAGES_PER_STEP,
+                        help="pages copied per step")
+    parser.add_argument('--max-seconds', type=float, default=DEFAULT_MAX_SECONDS,
+                        help="give up if the backup takes longer")
+    args = parser.parse_args()
+
+    result = backup_database(DB_PATH, args.target or default_backup_path(BACKUP_DIR, args.snapshot),
+                             snapshot=args.snapshot, pages=args.pages,
+                             max_seconds=args.max_seconds)
+    print(f"Backed up {DB_PATH} to {result['target']} "
+          f"({result['size']} bytes in {result['duration']:.2f}s)")
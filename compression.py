@@ -0,0 +1,126 @@
+"""
+Negotiated response compression.
+
+Compresses HTML, CSS, JSON and other text responses with brotli (when the
+optional ``brotli`` package is installed) or gzip, depending on the client's
+``Accept-Encoding``. Small bodies are sent as-is, and streamed responses are
+compressed chunk by chunk with a sync flush so nothing is held back.
+"""
+
+import gzip
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/xml',
+    'application/json',
+    'application/javascript',
+    'image/svg+xml',
+}
+
+
+def supported_encodings():
+    return ('br', 'gzip') if brotli else ('gzip',)
+
+
+def negotiate_encoding(accept_encodings):
+    """
+    Picks the best encoding we support from the client's Accept-Encoding.
+
+    Args:
+        accept_encodings (werkzeug.datastructures.Accept): Parsed header.
+
+    Returns:
+        str: ``'br'`` or ``'gzip'``.
+        None: If the client accepts neither.
+    """
+    best, best_quality = None, 0
+    for encoding in supported_encodings():
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(data, quality=min(level, 11))
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def compress_stream(chunks, encoding, level):
+    """
+    Compresses an iterable of byte chunks, flushing after each one so that
+    streamed responses reach the client without extra buffering.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=min(level, 11))
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process = compressor.compress
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+
+    try:
+        for chunk in chunks:
+            data = process(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def init_compression(app):
+    """
+    Registers the compression hook on the app.
+
+    Config:
+        COMPRESS_MIN_SIZE (int): Bodies smaller than this are not compressed.
+        COMPRESS_LEVEL (int): Compression level passed to gzip/brotli.
+        COMPRESS_MIMETYPES (set): Content types eligible for compression.
+    """
+    app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_MIMETYPES', COMPRESSIBLE_MIMETYPES)
+
+    @app.after_request
+    def compress_response(response):
+        if response.mimetype not in app.config['COMPRESS_MIMETYPES']:
+            return response
+        response.vary.add('Accept-Encoding')
+
+        if (response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.status_code < 200
+                or response.status_code in (204, 206, 304)):
+            return response
+
+        encoding = negotiate_encoding(request.accept_encodings)
+        if not encoding:
+            return response
+
+        level = app.config['COMPRESS_LEVEL']
+        if response.is_streamed:
+            response.response = compress_stream(response.iter_encoded(), encoding, level)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < app.config['COMPRESS_MIN_SIZE']:
+                return response
+            response.set_data(compress(data, encoding, level))
+
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -24,4 +24,68 @@ class DataManagerInterface(ABC):
 
     @abstractmethod
     def delete_movie(self, user_id):
-        pass
\ No newline at end of file
+        pass
+
+    @abstractmethod
+    def get_all_user_rows(self):
+        pass
+
+    @abstractmethod
+    def get_user_movie_rows(self, user_id):
+        pass
+
+    @abstractmethod
+    def get_user_movie_cards(self, user_id):
+        pass
+
+    @abstractmethod
+    def get_library_changes(self, user_id, since=0, limit=500):
+        pass
+
+    @abstractmethod
+    def get_latest_change_seq(self, user_id=None):
+        pass
+
+    @abstractmethod
+    def get_change_horizon(self, user_id=None):
+        pass
+
+    @abstractmethod
+    def wait_for_changes(self, timeout):
+        pass
+
+    @abstractmethod
+    def migrate_schema(self):
+        pass
+
+    @abstractmethod
+    def init_read_routing(self, app, pool_size=None, pool_timeout=None):
+        pass
+
+    @abstractmethod
+    def compact_library_changes(self, older_than):
+        pass
+
+    @abstractmethod
+    def collect_orphaned_movies(self, older_than, batch_size=100, pause=0.05, max_batches=None):
+        pass
+
+    @abstractmethod
+    def get_refresh_batch(self, batch_size, stale_before):
+        pass
+
+    @abstractmethod
+    def apply_movie_refresh(self, changes_by_id, refreshed_ids, fetched_at):
+        pass
+
+    @abstractmethod
+    def enable_incremental_vacuum(self):
+        pass
+
+    @abstractmethod
+    def incremental_vacuum(self, pages=100):
+        pass
+
+    @abstractmethod
+    def get_storage_stats(self):
+        pass
@@ -0,0 +1,1029 @@
+"""
+Sharded SQLite storage backend.
+
+Users and their library rows are partitioned across N SQLite files by a hash
+of ``user_id`` so that writers for different users never contend for the same
+database lock. The ``movies`` catalog lives in a single shared file, which also
+hands out globally unique user ids and records the shard count in use.
+
+Layout of ``db_dir``::
+
+    catalog.sqlite      movies, app state, user id sequence, shard metadata
+    shard_0.sqlite      users / user_movie_library / library_changes for shard 0
+    shard_1.sqlite      ...
+
+The app uses this backend when ``MOVIEWEB_SHARDS`` is set, see ``settings.py``.
+Use ``python -m datamanager.sharded_sqlite_data_manager rebalance DIR N`` to
+change the number of shards while the application is stopped.
+"""
+
+import argparse
+import os
+import shutil
+import threading
+import time
+import zlib
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import (Column, Integer, MetaData, String, Table, bindparam, create_engine,
+                        event, func, insert, select, text)
+from sqlalchemy.orm import sessionmaker
+
+from .data_manager_interface import DataManagerInterface
+from .sqlite_data_manager import (db, User, Movie, UserMovieLibrary, LibraryChange, AppState,
+                                  AUTO_VACUUM_INCREMENTAL, CHANGE_HORIZON_KEY, USER_ROWS_QUERY,
+                                  changes_table, library_table, movies_table, add_missing_columns,
+                                  convert_to_incremental_vacuum, delete_old_changes,
+                                  read_storage_stats, step_incremental_vacuum, write_movie_refresh)
+
+CATALOG_FILE_NAME = "catalog.sqlite"
+SHARD_FILE_NAME = "shard_{index}.sqlite"
+REBALANCE_CHUNK_SIZE = 500
+REBALANCE_STAGING_DIR = "rebalance-new"
+REBALANCE_RETIRED_DIR = "rebalance-old"
+
+# Each shard keeps the change log of its users, with its own sequence
+SHARD_TABLES = [User.__table__, UserMovieLibrary.__table__,
+                LibraryChange.__table__, AppState.__table__]
+REBALANCED_TABLES = [User.__table__, UserMovieLibrary.__table__]
+# The catalog's app_state holds process-wide state like the OMDb refresh budget
+CATALOG_TABLES = [Movie.__table__, AppState.__table__]
+
+# Library rows live in the user's shard and movies in the catalog, so the
+# joined reads of SQLiteDataManager are split into two lookups
+USER_MOVIE_IDS_QUERY = (select(library_table.c.movie_id)
+                        .where(library_table.c.user_id == bindparam('user_id')))
+
+MOVIE_ROWS_BY_ID_QUERY = (select(movies_table.c.id, movies_table.c.title,
+                                 movies_table.c.director, movies_table.c.year,
+                                 movies_table.c.rating)
+                          .where(movies_table.c.id.in_(bindparam('movie_ids', expanding=True))))
+
+MOVIE_CARDS_BY_ID_QUERY = (select(movies_table.c.id, movies_table.c.title,
+                                  movies_table.c.year, movies_table.c.poster)
+                           .where(movies_table.c.id.in_(bindparam('movie_ids', expanding=True))))
+
+STALE_MOVIES_QUERY = (select(movies_table.c.id, movies_table.c.title, movies_table.c.year,
+                             movies_table.c.rating, movies_table.c.poster,
+                             movies_table.c.fetched_at)
+                      .where((movies_table.c.fetched_at.is_(None))
+                             | (movies_table.c.fetched_at < bindparam('stale_before'))))
+
+MOVIE_POPULARITY_QUERY = (select(library_table.c.movie_id, func.count())
+                          .group_by(library_table.c.movie_id))
+
+# Orphan candidates are paged by id, since ones still in a library stay behind
+UNFETCHED_SINCE_QUERY = (select(movies_table.c.id)
+                         .where(movies_table.c.id > bindparam('after_id'),
+                                (movies_table.c.fetched_at.is_(None))
+                                | (movies_table.c.fetched_at < bindparam('cutoff')))
+                         .order_by(movies_table.c.id)
+                         .limit(bindparam('batch_size')))
+
+LINKED_MOVIE_IDS_QUERY = (select(library_table.c.movie_id).distinct()
+                          .where(library_table.c.movie_id.in_(
+                              bindparam('movie_ids', expanding=True))))
+
+SHARD_CHANGES_QUERY = (select(changes_table.c.seq, changes_table.c.op, changes_table.c.movie_id)
+                       .where(changes_table.c.user_id == bindparam('user_id'),
+                              changes_table.c.seq > bindparam('since'))
+                       .order_by(changes_table.c.seq)
+                       .limit(bindparam('limit')))
+
+# Same fields as the rows of SQLiteDataManager.get_library_changes
+LibraryChangeRow = namedtuple('LibraryChangeRow',
+                              'seq op movie_id title director year rating')
+
+catalog_metadata = MetaData()
+
+shard_meta = Table(
+    'shard_meta', catalog_metadata,
+    Column('key', String, primary_key=True),
+    Column('value', String, nullable=False),
+)
+
+user_id_sequence = Table(
+    'user_id_sequence', catalog_metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    sqlite_autoincrement=True,
+)
+
+
+def shard_for(user_id, shard_count):
+    """
+    Returns the shard index that owns the given user.
+
+    A CRC32 of the decimal id is used instead of ``hash()`` so the mapping is
+    stable across processes and Python versions.
+    """
+    return zlib.crc32(str(user_id).encode()) % shard_count
+
+
+def shard_path(db_dir, index):
+    return os.path.join(db_dir, SHARD_FILE_NAME.format(index=index))
+
+
+def create_sqlite_engine(path):
+    """
+    Creates an engine for one SQLite file with WAL journaling enabled, so
+    readers of a shard are not blocked by its writer.
+    """
+    engine = create_engine(f"sqlite:///{path}")
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
+    return engine
+
+
+def read_shard_count(catalog_engine):
+    value = read_meta(catalog_engine, 'shard_count')
+    return int(value) if value is not None else None
+
+
+def read_meta(catalog_engine, key):
+    with catalog_engine.connect() as connection:
+        return connection.execute(select(shard_meta.c.value).where(shard_meta.c.key == key)).scalar()
+
+
+def write_meta(catalog_engine, values):
+    """
+    Sets or, for None values, removes ``shard_meta`` keys in one transaction.
+    """
+    with catalog_engine.begin() as connection:
+        for key, value in values.items():
+            connection.execute(shard_meta.delete().where(shard_meta.c.key == key))
+            if value is not None:
+                connection.execute(insert(shard_meta).values(key=key, value=str(value)))
+
+
+def write_shard_count(catalog_engine, shard_count):
+    write_meta(catalog_engine, {'shard_count': shard_count})
+
+
+
+
+class ShardedSQLiteDataManager(DataManagerInterface):
+    def __init__(self, db_dir, shard_count=None):
+        self.db = db
+        self.db_dir = db_dir
+        os.makedirs(db_dir, exist_ok=True)
+
+        if shard_count is not None and shard_count < 1:
+            raise ValueError("shard_count must be a positive integer")
+
+        self.catalog_engine = create_sqlite_engine(os.path.join(db_dir, CATALOG_FILE_NAME))
+        db.metadata.create_all(self.catalog_engine, tables=CATALOG_TABLES)
+        catalog_metadata.create_all(self.catalog_engine)
+        try:
+            shard_count = self.resolve_shard_count(shard_count)
+        except ValueError:
+            self.catalog_engine.dispose()
+            raise
+
+        self.shard_count = shard_count
+        self.shard_engines = []
+        for index in range(shard_count):
+            engine = create_sqlite_engine(shard_path(db_dir, index))
+            db.metadata.create_all(engine, tables=SHARD_TABLES)
+            self.shard_engines.append(engine)
+
+        self.catalog_session = sessionmaker(bind=self.catalog_engine, expire_on_commit=False)
+        self.shard_sessions = [sessionmaker(bind=engine, expire_on_commit=False)
+                               for engine in self.shard_engines]
+        self.executor = ThreadPoolExecutor(max_workers=shard_count,
+                                           thread_name_prefix="shard")
+        self.changes_condition = threading.Condition()
+
+
+    def resolve_shard_count(self, shard_count):
+        """
+        Checks ``shard_count`` against the count recorded in the catalog, or
+        records it for a new database.
+        """
+        if read_meta(self.catalog_engine, 'rebalance_from') is not None:
+            raise ValueError(f"A rebalance of {self.db_dir} was interrupted; "
+                             f"run the rebalance tool again to finish it")
+
+        stored_count = read_shard_count(self.catalog_engine)
+        if shard_count is None:
+            shard_count = stored_count or 1
+        if stored_count is None:
+            write_shard_count(self.catalog_engine, shard_count)
+        elif stored_count != shard_count:
+            raise ValueError(f"Database in {self.db_dir} is split into {stored_count} shards, "
+                             f"not {shard_count}; run the rebalance tool first")
+        return shard_count
+
+
+    def session_for_user(self, user_id):
+        return self.shard_sessions[shard_for(user_id, self.shard_count)]()
+
+
+    def fan_out(self, func):
+        """
+        Runs ``func(session)`` against every shard in parallel and returns the
+        list of results in shard order.
+        """
+        def run(session_factory):
+            with session_factory() as session:
+                return func(session)
+
+        return list(self.executor.map(run, self.shard_sessions))
+
+
+    def record_change(self, session, user_id, movie_id, op):
+        """
+        Adds a change log entry to the transaction of the user's shard session.
+        """
+        session.add(LibraryChange(user_id=user_id, movie_id=movie_id, op=op))
+
+
+    def record_movie_change(self, movie_id, op):
+        """
+        Logs a change for every user whose library holds the movie. Movies live
+        in the catalog, so this runs after the catalog commit, one transaction
+        per shard.
+        """
+        self.record_movie_changes([movie_id], op)
+
+
+    def record_movie_changes(self, movie_ids, op):
+        """
+        Like ``record_movie_change`` for several movies, with one transaction
+        per shard.
+        """
+        def record(session):
+            entries = session.execute(
+                select(library_table.c.user_id, library_table.c.movie_id)
+                .where(library_table.c.movie_id.in_(movie_ids))).all()
+            for user_id, movie_id in entries:
+                self.record_change(session, user_id, movie_id, op)
+            session.commit()
+
+        self.fan_out(record)
+
+
+    def notify_changes(self):
+        with self.changes_condition:
+            self.changes_condition.notify_all()
+
+
+    def wait_for_changes(self, timeout):
+        """
+        Blocks until this process commits a library change or ``timeout``
+        seconds pass. Changes from other processes are only seen by polling.
+        """
+        with self.changes_condition:
+            self.changes_condition.wait(timeout)
+
+
+    def dispose(self):
+        self.executor.shutdown(wait=True)
+        self.catalog_engine.dispose()
+        for engine in self.shard_engines:
+            engine.dispose()
+
+
+    def database_files(self):
+        """
+        Returns ``(engine, path, tables)`` for the catalog and every shard.
+        """
+        files = [(self.catalog_engine, os.path.join(self.db_dir, CATALOG_FILE_NAME),
+                  CATALOG_TABLES + catalog_metadata.sorted_tables)]
+        files += [(engine, shard_path(self.db_dir, index), SHARD_TABLES)
+                  for index, engine in enumerate(self.shard_engines)]
+        return files
+
+
+    def migrate_schema(self):
+        """
+        Adds columns introduced after the catalog or a shard was created. The
+        tables themselves are created when the manager is constructed.
+        """
+        for engine, path, tables in self.database_files():
+            add_missing_columns(engine, tables)
+
+
+    def init_read_routing(self, app, pool_size=None, pool_timeout=None):
+        """
+        Nothing to route: every file is in WAL mode already and every read
+        uses its own short-lived session.
+        """
+
+
+    def get_all_users(self):
+        try:
+            results = self.fan_out(lambda session: session.query(User).all())
+            users = sorted((user for shard_users in results for user in shard_users),
+                           key=lambda user: user.id)
+            if not users:
+                print("No users found in the database")
+                return []
+            return users
+        except Exception as e:
+            print(f"Database query error: {e}")
+            return []
+
+
+    def get_user_movies(self, user_id):
+
+        if not isinstance(user_id, int) or user_id <= 0:
+            print("Error: user_id must be a positive integer")
+            return False
+        try:
+            with self.session_for_user(user_id) as session:
+                movie_ids = [movie_id for (movie_id,) in session.query(UserMovieLibrary.movie_id)
+                             .filter(UserMovieLibrary.user_id == user_id)]
+            if not movie_ids:
+                print("No movies found in the database")
+                return []
+            with self.catalog_session() as session:
+                return session.query(Movie).filter(Movie.id.in_(movie_ids)).all()
+
+        except Exception as e:
+            print(f"Database query error: {e}")
+            return []
+
+
+    def get_all_user_rows(self):
+        """
+        Read-only variant of ``get_all_users`` returning ``(id, name)`` rows.
+        Database errors propagate, so an empty result always means no users.
+        """
+        results = self.fan_out(lambda session: session.connection().execute(USER_ROWS_QUERY).all())
+        return sorted((row for rows in results for row in rows), key=lambda row: row.id)
+
+
+    def get_movie_rows_of_user(self, user_id, query):
+        if not isinstance(user_id, int) or user_id <= 0:
+            print("Error: user_id must be a positive integer")
+            return []
+        with self.session_for_user(user_id) as session:
+            movie_ids = (session.connection()
+                         .execute(USER_MOVIE_IDS_QUERY, {'user_id': user_id}).scalars().all())
+        if not movie_ids:
+            return []
+        with self.catalog_engine.connect() as connection:
+            return connection.execute(query, {'movie_ids': movie_ids}).all()
+
+
+    def get_user_movie_rows(self, user_id):
+        """
+        Read-only variant of ``get_user_movies`` returning the ``Movie.to_dict``
+        columns as plain rows. Database errors propagate, so an empty result
+        always means an empty library.
+        """
+        return self.get_movie_rows_of_user(user_id, MOVIE_ROWS_BY_ID_QUERY)
+
+
+    def get_user_movie_cards(self, user_id):
+        """
+        Read-only variant of ``get_user_movies`` returning the columns needed
+        to render a movie grid: ``(id, title, year, poster)``. Database errors
+        propagate like in ``get_user_movie_rows``.
+        """
+        return self.get_movie_rows_of_user(user_id, MOVIE_CARDS_BY_ID_QUERY)
+
+
+    def add_user(self, user):
+        # Validate the input object
+        if not isinstance(user, User):
+            print("Error: The provided object is not a User instance")
+            return False
+
+        try:
+            # Allocate a globally unique id before picking the shard
+            if not user.id:
+                with self.catalog_engine.begin() as connection:
+                    user.id = connection.execute(insert(user_id_sequence)).inserted_primary_key[0]
+
+            with self.session_for_user(user.id) as session:
+                session.add(user)
+                session.commit()
+
+            print('A new user has been successfully added to the database')
+            return True
+
+        except Exception as e:
+            print(f"Error: {e}")
+            return False
+
+
+    def add_movie(self, movie):
+        # Validate the input object
+        if not isinstance(movie, Movie):
+            print("Error: The provided object is not a Movie instance")
+            return False
+
+        try:
+            with self.catalog_session() as session:
+                session.add(movie)
+                session.commit()
+
+            print("A new movie has been successfully added to the database")
+            return True
+
+        except Exception as e:
+            print(f"Database insertion error: {e}")
+            return False
+
+
+    def update_movie(self, movie):
+        # Validate the input object
+        if not isinstance(movie, Movie):
+            print("Error: The provided object is not a Movie instance")
+            return False
+
+        if not movie.id:
+            print("Error: Missing movie ID")
+            return False
+
+        try:
+            with self.catalog_session() as session:
+                if not session.get(Movie, movie.id):
+                    print("Error: Movie with the specified ID does not exist")
+                    return False
+                session.merge(movie)
+                session.commit()
+            self.record_movie_change(movie.id, 'update')
+            self.notify_changes()
+
+            print("The movie has been successfully updated in the database")
+            return True
+
+        except Exception as e:
+            print(f"Database update error: {e}")
+            return False
+
+
+    def update_relationship(self, relationship):
+        # Validate the input object
+        if not isinstance(relationship, UserMovieLibrary):
+            print("Error: The provided object is not a UserMovieLibrary instance")
+            return False
+
+        try:
+            with self.session_for_user(relationship.user_id) as session:
+                if not session.get(UserMovieLibrary, relationship.id):
+                    print("Error: Relationship with the specified ID does not exist")
+                    return False
+                session.merge(relationship)
+                self.record_change(session, relationship.user_id, relationship.movie_id, 'update')
+                session.commit()
+            self.notify_changes()
+
+            print("The relationship has been successfully updated in the database")
+            return True
+
+        except Exception as e:
+            print(f"Database update error: {e}")
+            return False
+
+
+    def delete_movie(self, movie_id):
+        # Validate the input type
+        if not isinstance(movie_id, int) or movie_id <= 0:
+            print("Error: movie_id must be a positive integer")
+            return False
+
+        try:
+            with self.catalog_session() as session:
+                movie = session.get(Movie, movie_id)
+                if not movie:
+                    print(f"Error: No movie found with ID {movie_id}")
+                    return False
+                session.delete(movie)
+                session.commit()
+            self.record_movie_change(movie_id, 'delete')
+            self.notify_changes()
+
+            print(f"Movie with ID {movie_id} has been successfully deleted from the database")
+            return True
+
+        except Exception as e:
+            print(f"Database deletion error: {e}")
+            return False
+
+
+    def remove_movie_from_user(self, user_id, movie_id):
+        # Validate the input type
+        if not isinstance(movie_id, int) or movie_id <= 0:
+            print("Error: movie_id must be a positive integer")
+            return False
+        if not isinstance(user_id, int) or user_id <= 0:
+            print("Error: user_id must be a positive integer")
+            return False
+
+        try:
+            with self.session_for_user(user_id) as session:
+                relationship = (session.query(UserMovieLibrary)
+                                .filter(UserMovieLibrary.user_id == user_id,
+                                        UserMovieLibrary.movie_id == movie_id)
+                                .first())
+                if not relationship:
+                    print(f"Error: No relationship found with "
+                          f"UserID: {user_id} "
+                          f"MovieID: {movie_id} ")
+                    return False
+
+                session.delete(relationship)
+                self.record_change(session, user_id, movie_id, 'delete')
+                session.commit()
+            self.notify_changes()
+
+            print(f"Relationship with ID {relationship.id} has been successfully deleted from the database")
+            return True
+
+        except Exception as e:
+            print(f"Database deletion error: {e}")
+            return False
+
+
+    def add_user_movie_relationship(self, relationship):
+        # Validate the input type
+        if not isinstance(relationship, UserMovieLibrary):
+            print("Error: The provided object is not a UserMovieLibrary instance")
+            return False
+
+        try:
+            with self.session_for_user(relationship.user_id) as session:
+                session.add(relationship)
+                self.record_change(session, relationship.user_id, relationship.movie_id, 'insert')
+                session.commit()
+            self.notify_changes()
+
+            print("A new relationship has been successfully added to the database")
+            return True
+
+        except Exception as e:
+            print(f"Database insertion error: {e}")
+            return False
+
+
+    def get_user_by_id(self, user_id):
+        # Validate the input type
+        if not isinstance(user_id, int) or user_id <= 0:
+            print("Error: user_id must be a positive integer")
+            return False
+        try:
+            with self.session_for_user(user_id) as session:
+                user = session.get(User, user_id)
+            if not user:
+                print(f"Error: No user found with ID {user_id}")
+                return False
+            return user
+
+        except Exception as e:
+            print(f"Database query error: {e}")
+            return False
+
+
+    def get_movie_by_id(self, movie_id):
+        # Validate the input type
+        if not isinstance(movie_id, int) or movie_id <= 0:
+            print("Error: movie_id must be a positive integer")
+            return False
+        try:
+            with self.catalog_session() as session:
+                movie = session.get(Movie, movie_id)
+            if not movie:
+                print(f"Error: No movie found with ID {movie_id}")
+                return False
+            return movie
+
+        except Exception as e:
+            print(f"Database query error: {e}")
+            return False
+
+
+    def get_user_movie_relationship(self, user_id, movie_id):
+        # Validate the input type
+        if not isinstance(user_id, int) or user_id <= 0:
+            print("Error: user_id must be a positive integer")
+            return False
+        if not isinstance(movie_id, int) or movie_id <= 0:
+            print("Error: movie_id must be a positive integer")
+            return False
+        try:
+            with self.session_for_user(user_id) as session:
+                relationship = (session.query(UserMovieLibrary)
+                                .filter(UserMovieLibrary.user_id == user_id,
+                                        UserMovieLibrary.movie_id == movie_id)
+                                .first())
+            if not relationship:
+                print(f"Error: No relationship found with "
+                      f"UserID: {user_id} "
+                      f"MovieID: {movie_id} ")
+                return False
+            return relationship
+
+        except Exception as e:
+            print(f"Database query error: {e}")
+            return False
+
+
+    def get_library_changes(self, user_id, since=0, limit=500):
+        """
+        Returns the library changes of a user after sequence number ``since``,
+        oldest first, with the current movie columns from the catalog. They
+        are None for deletes or movies that no longer exist.
+        """
+        if not isinstance(user_id, int) or user_id <= 0:
+            print("Error: user_id must be a positive integer")
+            return []
+        try:
+            shard = self.shard_engines[shard_for(user_id, self.shard_count)]
+            with shard.connect() as connection:
+                changes = connection.execute(SHARD_CHANGES_QUERY, {
+                    'user_id': user_id, 'since': since, 'limit': limit}).all()
+            movies = {}
+            if changes:
+                with self.catalog_engine.connect() as connection:
+                    movies = {row.id: row for row in connection.execute(
+                        MOVIE_ROWS_BY_ID_QUERY,
+                        {'movie_ids': list({change.movie_id for change in changes})})}
+            result = []
+            for change in changes:
+                movie = movies.get(change.movie_id)
+                result.append(LibraryChangeRow(
+                    change.seq, change.op, change.movie_id,
+                    *((movie.title, movie.director, movie.year, movie.rating)
+                      if movie else (None, None, None, None))))
+            return result
+        except Exception as e:
+            print(f"Database query error: {e}")
+            return []
+
+
+    def get_latest_change_seq(self, user_id=None):
+        """
+        Returns the newest change sequence number of the user's shard. Every
+        shard has its own sequence, so without a user the highest of all is
+        returned, which is only useful for monitoring.
+        """
+        try:
+            query = select(func.max(changes_table.c.seq))
+            if user_id is not None:
+                with self.session_for_user(user_id) as session:
+                    return session.execute(query).scalar() or 0
+            return max(seq or 0 for seq in self.fan_out(lambda session: session.execute(query).scalar()))
+        except Exception as e:
+            print(f"Database query error: {e}")
+            return 0
+
+
+    def get_change_horizon(self, user_id=None):
+        """
+        Returns the change horizon of the user's shard, see
+        ``SQLiteDataManager.get_change_horizon``. Rebalancing moves it past
+        every sequence number handed out before, since users change shards.
+        """
+        def horizon(session):
+            state = session.get(AppState, CHANGE_HORIZON_KEY)
+            return int(state.value) if state else 0
+
+        if user_id is not None:
+            with self.session_for_user(user_id) as session:
+                return horizon(session)
+        return max(self.fan_out(horizon))
+
+
+    def compact_library_changes(self, older_than):
+        """
+        Compacts the change log of every shard, see
+        ``SQLiteDataManager.compact_library_changes``.
+
+        Returns:
+            int: Number of entries removed.
+        """
+        if not isinstance(older_than, datetime):
+            print("Error: older_than must be a datetime")
+            return 0
+
+        def compact(session):
+            removed = delete_old_changes(session, older_than)
+            session.commit()
+            return removed
+
+        try:
+            removed = sum(self.fan_out(compact))
+            print(f"Compacted {removed} library change log entries")
+            return removed
+        except Exception as e:
+            print(f"Database deletion error: {e}")
+            return 0
+
+
+    def collect_orphaned_movies(self, older_than, batch_size=100, pause=0.05, max_batches=None):
+        """
+        Deletes movies no user has in their library anymore, see
+        ``SQLiteDataManager.collect_orphaned_movies``.
+
+        Libraries live in the shards, so the check and the catalog DELETE
+        cannot share a transaction. Movies fetched after ``older_than`` are
+        kept, which covers a movie that was just added but not yet linked.
+
+        Returns:
+            int: Number of movies deleted.
+        """
+        deleted = 0
+        batches = 0
+        after_id = 0
+        try:
+            while max_batches is None or batches < max_batches:
+                with self.catalog_engine.connect() as connection:
+                    movie_ids = connection.execute(UNFETCHED_SINCE_QUERY, {
+                        'after_id': after_id, 'cutoff': older_than,
+                        'batch_size': batch_size}).scalars().all()
+                if not movie_ids:
+                    break
+                linked = set()
+                for shard_ids in self.fan_out(lambda session: session.execute(
+                        LINKED_MOVIE_IDS_QUERY, {'movie_ids': movie_ids}).scalars().all()):
+                    linked.update(shard_ids)
+                orphans = [movie_id for movie_id in movie_ids if movie_id not in linked]
+                if orphans:
+                    with self.catalog_engine.begin() as connection:
+                        deleted += connection.execute(
+                            movies_table.delete().where(movies_table.c.id.in_(orphans))).rowcount
+                batches += 1
+                after_id = movie_ids[-1]
+                if len(movie_ids) < batch_size:
+                    break
+                time.sleep(pause)
+
+            if deleted:
+                print(f"Deleted {deleted} orphaned movies from the database")
+            return deleted
+
+        except Exception as e:
+            print(f"Database deletion error: {e}")
+            return deleted
+
+
+    def get_refresh_batch(self, batch_size, stale_before):
+        """
+        Returns the movies due for a metadata refresh in the order of
+        ``SQLiteDataManager.get_refresh_batch``. Popularity is counted in
+        every shard, so the stale movies are sorted here.
+        """
+        with self.catalog_engine.connect() as connection:
+            movies = connection.execute(STALE_MOVIES_QUERY, {'stale_before': stale_before}).all()
+        if not movies:
+            return []
+        popularity = Counter()
+        for counts in self.fan_out(lambda session: session.execute(MOVIE_POPULARITY_QUERY).all()):
+            popularity.update(dict(counts))
+        movies.sort(key=lambda movie: (movie.fetched_at is not None, -popularity[movie.id],
+                                       movie.fetched_at or datetime.min))
+        return movies[:batch_size]
+
+
+    def apply_movie_refresh(self, changes_by_id, refreshed_ids, fetched_at):
+        """
+        Writes refreshed movie fields to the catalog and then logs an update
+        for every library holding a changed movie, like ``update_movie``.
+
+        Returns:
+            bool: True if the refresh was written.
+        """
+        try:
+            with self.catalog_session() as session:
+                write_movie_refresh(session, changes_by_id, refreshed_ids, fetched_at)
+                session.commit()
+            if changes_by_id:
+                self.record_movie_changes(list(changes_by_id), 'update')
+                self.notify_changes()
+            return True
+
+        except Exception as e:
+            print(f"Database update error: {e}")
+            return False
+
+
+    def enable_incremental_vacuum(self):
+        """
+        Switches the catalog and every shard to ``auto_vacuum=INCREMENTAL``, see
+        ``SQLiteDataManager.enable_incremental_vacuum``.
+
+        Returns:
+            bool: True if any file had to be converted.
+        """
+        converted = [convert_to_incremental_vacuum(engine)
+                     for engine, path, tables in self.database_files()]
+        if not any(converted):
+            return False
+        print(f"Switched {sum(converted)} database files to incremental auto vacuum")
+        return True
+
+
+    def incremental_vacuum(self, pages=100):
+        """
+        Returns up to ``pages`` free pages of every file to the file system.
+
+        Returns:
+            int: Number of free pages left in all files afterwards.
+        """
+        return sum(step_incremental_vacuum(engine, pages)
+                   for engine, path, tables in self.database_files())
+
+
+    def get_storage_stats(self):
+        """
+        Reports the statistics of ``SQLiteDataManager.get_storage_stats``
+        summed over the catalog and all shards. ``auto_vacuum`` is only
+        INCREMENTAL when every file uses it.
+
+        Returns:
+            dict: Storage statistics.
+        """
+        stats = None
+        for engine, path, tables in self.database_files():
+            file_stats = read_storage_stats(engine, path, tables)
+            if stats is None:
+                stats = file_stats
+                continue
+            for key in ('file_size', 'page_count', 'freelist_count'):
+                stats[key] += file_stats[key]
+            if file_stats['auto_vacuum'] != AUTO_VACUUM_INCREMENTAL:
+                stats['auto_vacuum'] = file_stats['auto_vacuum']
+            for name, table in file_stats['tables'].items():
+                total = stats['tables'].setdefault(name, {'rows': 0})
+                for key, value in table.items():
+                    total[key] = total.get(key, 0) + value
+        return stats
+
+
+
+
+def move_database(source, target):
+    """
+    Moves an SQLite file together with any WAL and shared-memory files. The
+    main file is moved last, so its location tells how far a move got.
+    """
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(source + suffix):
+            os.replace(source + suffix, target + suffix)
+    os.replace(source, target)
+
+
+def build_rebalanced_shards(db_dir, old_shard_count, new_shard_count, staging_dir):
+    """
+    Copies every user and library row from the current shards into
+    ``new_shard_count`` new shard files in ``staging_dir``.
+
+    Change logs are not copied: sequence numbers are only meaningful within a
+    shard. The new shards continue above the highest old sequence number and
+    put their change horizon there, so every client reloads its library once.
+
+    Returns:
+        int: Number of users copied.
+    """
+    highest_seq = 0
+    for index in range(old_shard_count):
+        old_engine = create_sqlite_engine(shard_path(db_dir, index))
+        db.metadata.create_all(old_engine, tables=SHARD_TABLES)
+        with old_engine.connect() as source:
+            highest_seq = max(highest_seq, source.execute(
+                select(func.max(changes_table.c.seq))).scalar() or 0)
+            state = source.execute(select(AppState.__table__.c.value)
+                                   .where(AppState.__table__.c.key == CHANGE_HORIZON_KEY)).scalar()
+            highest_seq = max(highest_seq, int(state or 0))
+        old_engine.dispose()
+
+    new_engines = []
+    for index in range(new_shard_count):
+        engine = create_sqlite_engine(shard_path(staging_dir, index))
+        db.metadata.create_all(engine, tables=SHARD_TABLES)
+        with engine.begin() as connection:
+            connection.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"),
+                               {'name': changes_table.name, 'seq': highest_seq})
+            connection.execute(insert(AppState.__table__).values(key=CHANGE_HORIZON_KEY,
+                                                                 value=str(highest_seq)))
+        new_engines.append(engine)
+
+    moved_users = 0
+    for index in range(old_shard_count):
+        old_engine = create_sqlite_engine(shard_path(db_dir, index))
+        with old_engine.connect() as source:
+            for table in REBALANCED_TABLES:
+                user_column = table.c.id if table is User.__table__ else table.c.user_id
+                result = source.execution_options(stream_results=True).execute(select(table))
+                while rows := result.fetchmany(REBALANCE_CHUNK_SIZE):
+                    batches = {}
+                    for row in rows:
+                        values = dict(row._mapping)
+                        if table is UserMovieLibrary.__table__:
+                            # Library ids are only unique within a shard
+                            del values['id']
+                        target = shard_for(values[user_column.name], new_shard_count)
+                        batches.setdefault(target, []).append(values)
+                    for target, batch in batches.items():
+                        with new_engines[target].begin() as destination:
+                            destination.execute(insert(table), batch)
+                    if table is User.__table__:
+                        moved_users += len(rows)
+        old_engine.dispose()
+
+    for engine in new_engines:
+        engine.dispose()
+    return moved_users
+
+
+def swap_rebalanced_shards(db_dir, old_shard_count, new_shard_count):
+    """
+    Moves the staged shards into place and the old ones out of the way.
+
+    Every step checks the files first, so this can be run again after a crash
+    at any point and carries on where the last run stopped.
+    """
+    staging_dir = os.path.join(db_dir, REBALANCE_STAGING_DIR)
+    retired_dir = os.path.join(db_dir, REBALANCE_RETIRED_DIR)
+    os.makedirs(retired_dir, exist_ok=True)
+    for index in range(max(old_shard_count, new_shard_count)):
+        staged = shard_path(staging_dir, index)
+        current = shard_path(db_dir, index)
+        # A file in db_dir is an old shard unless its replacement was moved in
+        if os.path.exists(current) and (os.path.exists(staged) or index >= new_shard_count):
+            move_database(current, shard_path(retired_dir, index))
+        if os.path.exists(staged):
+            move_database(staged, current)
+
+
+def rebalance_shards(db_dir, new_shard_count):
+    """
+    Redistributes users and library rows across ``new_shard_count`` shards.
+
+    Must be run while the application is stopped. The new shards are built in a
+    staging directory first and the new shard count is recorded together with
+    a pending-rebalance marker before any shard file is moved. If the tool is
+    interrupted, running it again either rebuilds the staged shards (before
+    that point) or finishes moving the files (after it).
+
+    Args:
+        db_dir (str): Directory holding the catalog and shard files.
+        new_shard_count (int): Number of shards to split the data into.
+
+    Returns:
+        int: Number of users moved, or 0 when an interrupted rebalance was
+        finished instead.
+    """
+    if new_shard_count < 1:
+        raise ValueError("new_shard_count must be a positive integer")
+
+    catalog_engine = create_sqlite_engine(os.path.join(db_dir, CATALOG_FILE_NAME))
+    staging_dir = os.path.join(db_dir, REBALANCE_STAGING_DIR)
+    retired_dir = os.path.join(db_dir, REBALANCE_RETIRED_DIR)
+    try:
+        pending_from = read_meta(catalog_engine, 'rebalance_from')
+        if pending_from is not None:
+            pending_count = read_shard_count(catalog_engine)
+            print(f"Finishing interrupted rebalance from {pending_from} to {pending_count} shards")
+            swap_rebalanced_shards(db_dir, int(pending_from), pending_count)
+            write_meta(catalog_engine, {'rebalance_from': None})
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            shutil.rmtree(retired_dir, ignore_errors=True)
+            if pending_count == new_shard_count:
+                return 0
+
+        old_shard_count = read_shard_count(catalog_engine)
+        if old_shard_count is None:
+            raise ValueError(f"No sharded database found in {db_dir}")
+
+        # Leftovers of a run that stopped before the switch-over hold nothing
+        # the old shards do not have
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        shutil.rmtree(retired_dir, ignore_errors=True)
+        os.makedirs(staging_dir)
+        moved_users = build_rebalanced_shards(db_dir, old_shard_count, new_shard_count, staging_dir)
+
+        write_meta(catalog_engine, {'shard_count': new_shard_count,
+                                    'rebalance_from': old_shard_count})
+        swap_rebalanced_shards(db_dir, old_shard_count, new_shard_count)
+        write_meta(catalog_engine, {'rebalance_from': None})
+        shutil.rmtree(staging_dir)
+        shutil.rmtree(retired_dir)
+    finally:
+        catalog_engine.dispose()
+
+    print(f"Moved {moved_users} users from {old_shard_count} to {new_shard_count} shards")
+    return moved_users
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sharded SQLite maintenance tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    rebalance_parser = subparsers.add_parser('rebalance', help="change the number of shards offline")
+    rebalance_parser.add_argument('db_dir')
+    rebalance_parser.add_argument('shard_count', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'rebalance':
+        rebalance_shards(args.db_dir, args.shard_count)
@@ -1,9 +1,37 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from flask import g
+from flask.globals import app_ctx
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import (bindparam, create_engine, delete, event, exists, func, inspect, select, text,
+                        update)
+from sqlalchemy.engine import URL
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import scoped_session, sessionmaker
 from .data_manager_interface import DataManagerInterface
 
 db = SQLAlchemy()
 
 
+def utcnow():
+    """
+    Returns the current UTC time as a naive datetime, matching the values
+    SQLite's CURRENT_TIMESTAMP column defaults store.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def raise_if_pool_timeout(e):
+    """
+    Re-raises a connection pool checkout timeout, so callers see an exhausted
+    pool instead of the False or empty result other database errors return.
+    """
+    if isinstance(e, PoolTimeoutError):
+        raise e
+
+
 
 
 class User(db.Model):
@@ -39,6 +67,7 @@ class Movie(db.Model):
     year = db.Column(db.String, nullable=True)
     rating = db.Column(db.Integer, nullable=True)
     poster = db.Column(db.String, nullable=True)
+    fetched_at = db.Column(db.DateTime, nullable=True, default=db.func.current_timestamp())
 
     users = db.relationship('UserMovieLibrary', backref='movie', lazy=True)
 
@@ -87,20 +116,371 @@ class UserMovieLibrary(db.Model):
 
 
 
+class LibraryChange(db.Model):
+    """
+    Append-only log of changes to users' libraries, used for delta sync.
+    ``seq`` only ever grows, even after old entries are compacted away.
+    """
+    __tablename__ = 'library_changes'
+
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    movie_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String, nullable=False)  # 'insert', 'update' or 'delete'
+    changed_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+
+    __table_args__ = (db.Index('ix_library_changes_user_seq', 'user_id', 'seq'),
+                      {'sqlite_autoincrement': True})
+
+    def __repr__(self):
+        return (f"Library_Change (seq={self.seq}, user_id={self.user_id}, "
+                f"movie_id={self.movie_id}, op={self.op}, changed_at={self.changed_at})")
+
+
+
+
+class AppState(db.Model):
+    __tablename__ = 'app_state'
+
+    key = db.Column(db.String, primary_key=True)
+    value = db.Column(db.String, nullable=True)
+
+    def __repr__(self):
+        return f"App_State (key={self.key}, value={self.value})"
+
+
+
+
+# Read-only Core statements. They are built once at import time so SQLAlchemy's
+# compiled cache always gets a hit, select only the columns the callers render
+# and return plain rows without ORM identity-map bookkeeping.
+users_table = User.__table__
+movies_table = Movie.__table__
+library_table = UserMovieLibrary.__table__
+
+USER_ROWS_QUERY = (select(users_table.c.id, users_table.c.name)
+                   .order_by(users_table.c.id))
+
+USER_MOVIE_ROWS_QUERY = (select(movies_table.c.id, movies_table.c.title,
+                                movies_table.c.director, movies_table.c.year,
+                                movies_table.c.rating)
+                         .join(library_table, library_table.c.movie_id == movies_table.c.id)
+                         .where(library_table.c.user_id == bindparam('user_id')))
+
+USER_MOVIE_CARDS_QUERY = (select(movies_table.c.id, movies_table.c.title,
+                                 movies_table.c.year, movies_table.c.poster)
+                          .join(library_table, library_table.c.movie_id == movies_table.c.id)
+                          .where(library_table.c.user_id == bindparam('user_id')))
+
+changes_table = LibraryChange.__table__
+
+LIBRARY_CHANGES_QUERY = (select(changes_table.c.seq, changes_table.c.op,
+                                changes_table.c.movie_id, movies_table.c.title,
+                                movies_table.c.director, movies_table.c.year,
+                                movies_table.c.rating)
+                         .outerjoin(movies_table, movies_table.c.id == changes_table.c.movie_id)
+                         .where(changes_table.c.user_id == bindparam('user_id'),
+                                changes_table.c.seq > bindparam('since'))
+                         .order_by(changes_table.c.seq)
+                         .limit(bindparam('limit')))
+
+CHANGE_HORIZON_KEY = 'library_changes.horizon'
+
+CHANGE_HORIZON_QUERY = (select(AppState.__table__.c.value)
+                        .where(AppState.__table__.c.key == CHANGE_HORIZON_KEY))
+
+# Movies due for a metadata refresh: never fetched first, then the most popular
+movie_popularity = (select(func.count()).where(library_table.c.movie_id == movies_table.c.id)
+                    .correlate(movies_table).scalar_subquery())
+REFRESH_BATCH_QUERY = (select(movies_table.c.id, movies_table.c.title, movies_table.c.year,
+                              movies_table.c.rating, movies_table.c.poster)
+                       .where((movies_table.c.fetched_at.is_(None))
+                              | (movies_table.c.fetched_at < bindparam('stale_before')))
+                       .order_by(movies_table.c.fetched_at.is_not(None), movie_popularity.desc(),
+                                 movies_table.c.fetched_at)
+                       .limit(bindparam('batch_size')))
+
+ORPHANED_MOVIES_QUERY = (select(movies_table.c.id)
+                         .where(~exists().where(library_table.c.movie_id == movies_table.c.id),
+                                (movies_table.c.fetched_at.is_(None))
+                                | (movies_table.c.fetched_at < bindparam('cutoff')))
+                         .limit(bindparam('batch_size')))
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+# Set on flask.g once a request (or job) committed through the writer, so its
+# later reads see its own writes
+WROTE_FLAG = 'db_wrote'
+
+
+# Helpers working on a single SQLite file or transaction, shared with the
+# sharded backend
+
+def add_missing_columns(engine, tables):
+    """
+    Adds columns introduced after the database file was created. Only
+    nullable columns can be added this way.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} "
+                                        f"ADD COLUMN {column.name} {column_type}"))
+                print(f"Added column {table.name}.{column.name}")
+
+
+def delete_old_changes(session, older_than):
+    """
+    Deletes the change log entries ``compact_library_changes`` may drop in the
+    session's transaction and moves the change horizon past removed deletes.
+
+    Returns:
+        int: Number of entries removed.
+    """
+    later = changes_table.alias('later')
+    superseded = session.execute(
+        delete(changes_table)
+        .where(changes_table.c.changed_at < older_than,
+               exists().where(later.c.user_id == changes_table.c.user_id,
+                              later.c.movie_id == changes_table.c.movie_id,
+                              later.c.seq > changes_table.c.seq))
+    ).rowcount
+
+    old_deletes = (changes_table.c.op == 'delete') & (changes_table.c.changed_at < older_than)
+    horizon = session.execute(select(func.max(changes_table.c.seq)).where(old_deletes)).scalar()
+    removed_deletes = 0
+    if horizon:
+        removed_deletes = session.execute(delete(changes_table).where(old_deletes)).rowcount
+        horizon = max(horizon, int(session.execute(CHANGE_HORIZON_QUERY).scalar() or 0))
+        session.merge(AppState(key=CHANGE_HORIZON_KEY, value=str(horizon)))
+    return superseded + removed_deletes
+
+
+def write_movie_refresh(session, changes_by_id, refreshed_ids, fetched_at):
+    """
+    Writes refreshed movie fields with one executemany UPDATE per distinct set
+    of changed columns, plus one stamping ``fetched_at`` on ``refreshed_ids``.
+    """
+    groups = {}
+    for movie_id, changes in changes_by_id.items():
+        groups.setdefault(tuple(sorted(changes)), []).append(dict(changes, movie_id=movie_id))
+
+    for fields, params in groups.items():
+        statement = (update(movies_table).where(movies_table.c.id == bindparam('movie_id'))
+                     .values({field: bindparam(field) for field in fields}))
+        session.execute(statement, params)
+
+    if refreshed_ids:
+        statement = (update(movies_table).where(movies_table.c.id == bindparam('movie_id'))
+                     .values(fetched_at=bindparam('fetched_at')))
+        session.execute(statement, [{'movie_id': movie_id, 'fetched_at': fetched_at}
+                                    for movie_id in refreshed_ids])
+
+
+def convert_to_incremental_vacuum(engine):
+    """
+    Switches one database file to ``auto_vacuum=INCREMENTAL``, see
+    ``SQLiteDataManager.enable_incremental_vacuum``.
+
+    Returns:
+        bool: True if the file had to be converted.
+    """
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        if connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() == AUTO_VACUUM_INCREMENTAL:
+            return False
+        connection.exec_driver_sql(f"PRAGMA auto_vacuum={AUTO_VACUUM_INCREMENTAL}")
+        connection.exec_driver_sql("VACUUM")
+    return True
+
+
+def step_incremental_vacuum(engine, pages):
+    """
+    Returns up to ``pages`` free pages of one database file to the file system.
+
+    Returns:
+        int: Number of free pages left afterwards.
+    """
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        # The pragma frees one page per step, so it has to be stepped to
+        # completion on the DB-API cursor
+        cursor = connection.connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        finally:
+            cursor.close()
+        return connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+
+
+def read_storage_stats(engine, file_name, tables):
+    """
+    Reports the size, free pages, auto vacuum mode and row counts of
+    ``tables`` for one database file, see ``SQLiteDataManager.get_storage_stats``.
+    """
+    with engine.connect() as connection:
+        stats = {
+            'file_size': os.path.getsize(file_name) if os.path.exists(file_name) else 0,
+            'page_size': connection.exec_driver_sql("PRAGMA page_size").scalar(),
+            'page_count': connection.exec_driver_sql("PRAGMA page_count").scalar(),
+            'freelist_count': connection.exec_driver_sql("PRAGMA freelist_count").scalar(),
+            'auto_vacuum': connection.exec_driver_sql("PRAGMA auto_vacuum").scalar(),
+            'tables': {},
+        }
+        for table in tables:
+            stats['tables'][table.name] = {'rows': connection.execute(
+                select(func.count()).select_from(table)).scalar()}
+        try:
+            sizes = connection.exec_driver_sql(
+                "SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").all()
+        except Exception:
+            sizes = []
+        for name, size in sizes:
+            if name in stats['tables']:
+                stats['tables'][name]['bytes'] = size
+    return stats
+
+
+
+
 class SQLiteDataManager(DataManagerInterface):
     def __init__(self, db_file_name):
         self.db = db
         self.db_file_name = db_file_name
+        self.changes_condition = threading.Condition()
+        self.read_engine = None
+        self.read_sessions = None
+
+
+    def init_read_routing(self, app, pool_size=None, pool_timeout=None):
+        """
+        Sends read-only calls to a separate pool of read-only connections, so
+        GET traffic does not queue behind writers for the writer pool. The
+        database is switched to WAL mode, which lets readers run alongside the
+        writer.
+
+        Reads go back to the writer session once the current request has
+        committed a write, so a request always sees its own changes. Objects
+        returned by reads are attached to the reader session; pass them to
+        the update methods, which merge them into the writer session. Calling
+        it again replaces the reader pool.
+
+        Args:
+            app (Flask): The app whose app contexts scope the reader sessions.
+            pool_size (int): Read connections, defaults to the CPU count.
+            pool_timeout (float): Seconds to wait for a free read connection,
+                defaults to the writer pool's ``pool_timeout``.
+        """
+        first_setup = self.read_sessions is None
+        pool_size = pool_size or os.cpu_count() or 4
+        if pool_timeout is None:
+            pool_timeout = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}).get('pool_timeout', 30)
+        with app.app_context():
+            with self.db.engine.connect() as connection:
+                connection.exec_driver_sql("PRAGMA journal_mode=WAL")
+
+        self.read_engine = create_engine(
+            URL.create('sqlite', database=f"file:{os.path.abspath(self.db_file_name)}",
+                       query={'mode': 'ro', 'uri': 'true'}),
+            pool_size=pool_size, max_overflow=pool_size, pool_timeout=pool_timeout)
+
+        @event.listens_for(self.read_engine, 'connect')
+        def set_query_only(dbapi_connection, connection_record):
+            dbapi_connection.execute("PRAGMA query_only=ON")
+
+        # Scoped like Flask-SQLAlchemy's session: one per app context. Readers
+        # never write, so there is nothing to flush or expire.
+        self.read_sessions = scoped_session(
+            sessionmaker(bind=self.read_engine, autoflush=False, expire_on_commit=False),
+            scopefunc=lambda: id(app_ctx._get_current_object()))
+
+        if not first_setup:
+            return
+
+        @app.teardown_appcontext
+        def remove_read_session(exception):
+            self.read_sessions.remove()
+
+
+    def read_session(self):
+        """
+        Returns the session read-only calls should use.
+        """
+        if self.read_sessions is None or g.get(WROTE_FLAG):
+            return self.db.session
+        return self.read_sessions()
+
+
+    def read_connection(self):
+        """
+        Returns a short-lived connection for reads outside the ORM session.
+        Committed writes are always visible to a new connection.
+        """
+        return (self.read_engine or self.db.engine).connect()
+
+
+    def commit(self):
+        """
+        Commits the writer session and routes this context's later reads to it.
+        """
+        self.db.session.commit()
+        g.setdefault(WROTE_FLAG, True)
+
+
+    def migrate_schema(self):
+        """
+        Creates missing tables and adds columns introduced after the database
+        file was created. Only nullable columns can be added this way.
+        """
+        self.db.create_all()
+        add_missing_columns(self.db.engine, self.db.metadata.sorted_tables)
+
+
+    def record_change(self, user_id, movie_id, op):
+        """
+        Adds a change log entry to the current transaction.
+        """
+        self.db.session.add(LibraryChange(user_id=user_id, movie_id=movie_id, op=op))
+
+
+    def record_movie_change(self, movie_id, op):
+        """
+        Adds a change log entry for every user whose library holds the movie.
+        """
+        user_ids = self.db.session.execute(
+            select(library_table.c.user_id).where(library_table.c.movie_id == movie_id)).scalars()
+        for user_id in user_ids:
+            self.record_change(user_id, movie_id, op)
+
+
+    def notify_changes(self):
+        with self.changes_condition:
+            self.changes_condition.notify_all()
+
+
+    def wait_for_changes(self, timeout):
+        """
+        Blocks until this process commits a library change or ``timeout``
+        seconds pass. Changes from other processes are only seen by polling.
+        """
+        with self.changes_condition:
+            self.changes_condition.wait(timeout)
 
 
     def get_all_users(self):
         try:
-            users = User.query.all()
+            users = self.read_session().query(User).all()
             if not users:
                 print("No users found in the database")
                 return []
             return users
         except Exception as e:
+            raise_if_pool_timeout(e)
             print(f"Database query error: {e}")
             return []
 
@@ -111,7 +491,7 @@ class SQLiteDataManager(DataManagerInterface):
             print("Error: user_id must be a positive integer")
             return False
         try:
-            movies = (Movie.query.join(UserMovieLibrary)
+            movies = (self.read_session().query(Movie).join(UserMovieLibrary)
                       .filter(UserMovieLibrary.user_id == user_id).all())
             if not movies:
                 print("No movies found in the database")
@@ -119,11 +499,46 @@ class SQLiteDataManager(DataManagerInterface):
             return movies
 
         except Exception as e:
+            raise_if_pool_timeout(e)
             print(f"Database query error: {e}")
             return []
 
 
 
+    def get_all_user_rows(self):
+        """
+        Read-only variant of ``get_all_users`` returning ``(id, name)`` rows.
+        Database errors propagate, so an empty result always means no users.
+        """
+        return self.read_session().connection().execute(USER_ROWS_QUERY).all()
+
+
+    def get_user_movie_rows(self, user_id):
+        """
+        Read-only variant of ``get_user_movies`` returning the ``Movie.to_dict``
+        columns as plain rows. Database errors propagate, so an empty result
+        always means an empty library.
+        """
+        if not isinstance(user_id, int) or user_id <= 0:
+            print("Error: user_id must be a positive integer")
+            return []
+        return (self.read_session().connection()
+                .execute(USER_MOVIE_ROWS_QUERY, {'user_id': user_id}).all())
+
+
+    def get_user_movie_cards(self, user_id):
+        """
+        Read-only variant of ``get_user_movies`` returning the columns needed
+        to render a movie grid: ``(id, title, year, poster)``. Database errors
+        propagate like in ``get_user_movie_rows``.
+        """
+        if not isinstance(user_id, int) or user_id <= 0:
+            print("Error: user_id must be a positive integer")
+            return []
+        return (self.read_session().connection()
+                .execute(USER_MOVIE_CARDS_QUERY, {'user_id': user_id}).all())
+
+
     def add_user(self, user):
         # Validate the input object
         if not isinstance(user, User):
@@ -133,13 +548,14 @@ class SQLiteDataManager(DataManagerInterface):
         try:
             # Add the user to the database
             self.db.session.add(user)
-            self.db.session.commit()
+            self.commit()
 
             print('A new user has been successfully added to the database')
             return True
 
         except Exception as e:
             self.db.session.rollback()  # Rollback on error
+            raise_if_pool_timeout(e)
             print(f"Error: {e}")
             return False
 
@@ -153,13 +569,14 @@ class SQLiteDataManager(DataManagerInterface):
         try:
             # Add the movie to the database
             self.db.session.add(movie)
-            self.db.session.commit()
+            self.commit()
 
             print("A new movie has been successfully added to the database")
             return True
 
         except Exception as e:
             self.db.session.rollback()  # Rollback on error
+            raise_if_pool_timeout(e)
             print(f"Database insertion error: {e}")
             return False
 
@@ -176,21 +593,23 @@ class SQLiteDataManager(DataManagerInterface):
 
         try:
             # Retrieve the existing movie
-            old_movie = Movie.query.get(movie.id)
+            old_movie = self.db.session.get(Movie, movie.id)
             if not old_movie:
                 print("Error: Movie with the specified ID does not exist")
                 return False
 
-            # Update the movie
-            self.db.session.delete(old_movie)
-            self.db.session.add(movie)
-            self.db.session.commit()
+            # Update the movie, which may come from the reader session
+            self.db.session.merge(movie)
+            self.record_movie_change(movie.id, 'update')
+            self.commit()
+            self.notify_changes()
 
             print("The movie has been successfully updated in the database")
             return True
 
         except Exception as e:
             self.db.session.rollback()  # Rollback on error
+            raise_if_pool_timeout(e)
             print(f"Database update error: {e}")
             return False
 
@@ -203,21 +622,23 @@ class SQLiteDataManager(DataManagerInterface):
 
         try:
             # Retrieve the existing relationship
-            old_relationship = UserMovieLibrary.query.get(relationship.id)
-            if not relationship:
+            old_relationship = self.db.session.get(UserMovieLibrary, relationship.id)
+            if not old_relationship:
                 print("Error: Relationship with the specified ID does not exist")
                 return False
 
-            # Update the relationship
-            self.db.session.delete(old_relationship)
-            self.db.session.add(relationship)
-            self.db.session.commit()
+            # Update the relationship, which may come from the reader session
+            self.db.session.merge(relationship)
+            self.record_change(relationship.user_id, relationship.movie_id, 'update')
+            self.commit()
+            self.notify_changes()
 
             print("The relationship has been successfully updated in the database")
             return True
 
         except Exception as e:
             self.db.session.rollback()  # Rollback on error
+            raise_if_pool_timeout(e)
             print(f"Database update error: {e}")
             return False
 
@@ -230,20 +651,23 @@ class SQLiteDataManager(DataManagerInterface):
 
         try:
             # Retrieve the movie by ID
-            movie = Movie.query.get(movie_id)
+            movie = self.db.session.get(Movie, movie_id)
             if not movie:
                 print(f"Error: No movie found with ID {movie_id}")
                 return False
 
             # Delete the movie
+            self.record_movie_change(movie_id, 'delete')
             self.db.session.delete(movie)
-            self.db.session.commit()
+            self.commit()
+            self.notify_changes()
 
             print(f"Movie with ID {movie_id} has been successfully deleted from the database")
             return True
 
         except Exception as e:
             self.db.session.rollback()  # Rollback on error
+            raise_if_pool_timeout(e)
             print(f"Database deletion error: {e}")
             return False
 
@@ -270,13 +694,16 @@ class SQLiteDataManager(DataManagerInterface):
 
             # Delete the movie
             self.db.session.delete(relationship)
-            self.db.session.commit()
+            self.record_change(user_id, movie_id, 'delete')
+            self.commit()
+            self.notify_changes()
 
             print(f"Relationship with ID {relationship.id} has been successfully deleted from the database")
             return True
 
         except Exception as e:
             self.db.session.rollback()  # Rollback on error
+            raise_if_pool_timeout(e)
             print(f"Database deletion error: {e}")
             return False
 
@@ -290,13 +717,16 @@ class SQLiteDataManager(DataManagerInterface):
         try:
             # Add the relationship to the database
             self.db.session.add(relationship)
-            self.db.session.commit()
+            self.record_change(relationship.user_id, relationship.movie_id, 'insert')
+            self.commit()
+            self.notify_changes()
 
             print("A new relationship has been successfully added to the database")
             return True
 
         except Exception as e:
             self.db.session.rollback()  # Rollback on error
+            raise_if_pool_timeout(e)
             print(f"Database insertion error: {e}")
             return False
 
@@ -307,13 +737,14 @@ class SQLiteDataManager(DataManagerInterface):
             print("Error: user_id must be a positive integer")
             return False
         try:
-            user = User.query.get(user_id)
+            user = self.read_session().get(User, user_id)
             if not user:
                 print(f"Error: No user found with ID {user_id}")
                 return  False
             return user
 
         except Exception as e:
+            raise_if_pool_timeout(e)
             print(f"Database insertion error: {e}")
             return False
 
@@ -324,13 +755,14 @@ class SQLiteDataManager(DataManagerInterface):
             print("Error: movie_id must be a positive integer")
             return False
         try:
-            movie = Movie.query.get(movie_id)
+            movie = self.read_session().get(Movie, movie_id)
             if not movie:
                 print(f"Error: No movie found with ID {movie_id}")
                 return False
             return movie
 
         except Exception as e:
+            raise_if_pool_timeout(e)
             print(f"Database insertion error: {e}")
             return False
 
@@ -344,7 +776,7 @@ class SQLiteDataManager(DataManagerInterface):
             print("Error: movie_id must be a positive integer")
             return False
         try:
-            relationship = (UserMovieLibrary.query
+            relationship = (self.read_session().query(UserMovieLibrary)
                             .filter(UserMovieLibrary.user_id == user_id,
                                     UserMovieLibrary.movie_id == movie_id)
                             .first())
@@ -356,5 +788,210 @@ class SQLiteDataManager(DataManagerInterface):
             return relationship
 
         except Exception as e:
+            raise_if_pool_timeout(e)
             print(f"Database insertion error: {e}")
-            return False
\ No newline at end of file
+            return False
+
+
+    def get_library_changes(self, user_id, since=0, limit=500):
+        """
+        Returns the library changes of a user after sequence number ``since``,
+        oldest first. Insert and update rows carry the current movie columns;
+        they are NULL for deletes or movies that no longer exist.
+
+        Uses a short-lived connection so long-polling callers never keep a
+        transaction open.
+        """
+        if not isinstance(user_id, int) or user_id <= 0:
+            print("Error: user_id must be a positive integer")
+            return []
+        try:
+            with self.read_connection() as connection:
+                return connection.execute(LIBRARY_CHANGES_QUERY, {
+                    'user_id': user_id, 'since': since, 'limit': limit}).all()
+        except Exception as e:
+            raise_if_pool_timeout(e)
+            print(f"Database query error: {e}")
+            return []
+
+
+    def get_latest_change_seq(self, user_id=None):
+        """
+        Returns the newest change sequence number. There is one sequence for
+        all users, so ``user_id`` is only accepted for the sharded backend.
+        """
+        try:
+            with self.read_connection() as connection:
+                return connection.execute(select(func.max(changes_table.c.seq))).scalar() or 0
+        except Exception as e:
+            raise_if_pool_timeout(e)
+            print(f"Database query error: {e}")
+            return 0
+
+
+    def get_change_horizon(self, user_id=None):
+        """
+        Returns the highest sequence number removed by compaction whose change
+        is no longer represented in the log. Clients that last synced before
+        it must download the full library again. Like the sequence, the
+        horizon is shared by all users.
+
+        Uses a short-lived connection, so an event stream checking it does
+        not hold a pooled connection for as long as it stays open.
+        """
+        with self.read_connection() as connection:
+            horizon = connection.execute(CHANGE_HORIZON_QUERY).scalar()
+        return int(horizon) if horizon else 0
+
+
+    def compact_library_changes(self, older_than):
+        """
+        Compacts change log entries older than ``older_than`` (a datetime).
+
+        Entries superseded by a later change to the same library entry are
+        dropped, since clients apply inserts and updates as upserts. Old
+        trailing deletes are dropped too, and the change horizon moves past
+        them.
+
+        Returns:
+            int: Number of entries removed.
+        """
+        if not isinstance(older_than, datetime):
+            print("Error: older_than must be a datetime")
+            return 0
+
+        try:
+            removed = delete_old_changes(self.db.session, older_than)
+            self.commit()
+            print(f"Compacted {removed} library change log entries")
+            return removed
+
+        except Exception as e:
+            self.db.session.rollback()  # Rollback on error
+            raise_if_pool_timeout(e)
+            print(f"Database deletion error: {e}")
+            return 0
+
+
+    def collect_orphaned_movies(self, older_than, batch_size=100, pause=0.05, max_batches=None):
+        """
+        Deletes movies no user has in their library anymore.
+
+        Works in batches of ``batch_size`` rows, each in its own short
+        transaction with a pause in between, so writers are never locked out
+        for long. Movies fetched after ``older_than`` are kept, which protects
+        a movie that was just added but not yet linked to its user.
+
+        Returns:
+            int: Number of movies deleted.
+        """
+        deleted = 0
+        batches = 0
+        try:
+            while max_batches is None or batches < max_batches:
+                movie_ids = self.db.session.execute(ORPHANED_MOVIES_QUERY, {
+                    'cutoff': older_than, 'batch_size': batch_size}).scalars().all()
+                if not movie_ids:
+                    break
+                # Re-check the library in the DELETE itself in case a user just added one
+                result = self.db.session.execute(
+                    delete(movies_table)
+                    .where(movies_table.c.id.in_(movie_ids),
+                           ~exists().where(library_table.c.movie_id == movies_table.c.id)))
+                self.commit()
+                deleted += result.rowcount
+                batches += 1
+                if len(movie_ids) < batch_size:
+                    break
+                time.sleep(pause)
+
+            if deleted:
+                print(f"Deleted {deleted} orphaned movies from the database")
+            return deleted
+
+        except Exception as e:
+            self.db.session.rollback()  # Rollback on error
+            raise_if_pool_timeout(e)
+            print(f"Database deletion error: {e}")
+            return deleted
+
+
+    def get_refresh_batch(self, batch_size, stale_before):
+        """
+        Returns ``(id, title, year, rating, poster)`` rows of the movies due for
+        a metadata refresh: never fetched or fetched before ``stale_before``,
+        never fetched first, then by popularity and staleness.
+        """
+        return self.db.session.execute(REFRESH_BATCH_QUERY, {
+            'stale_before': stale_before, 'batch_size': batch_size}).all()
+
+
+    def apply_movie_refresh(self, changes_by_id, refreshed_ids, fetched_at):
+        """
+        Writes refreshed movie fields, stamps ``fetched_at`` on every movie in
+        ``refreshed_ids`` and logs an update for every library holding a
+        changed movie, all in one transaction.
+
+        Args:
+            changes_by_id (dict): Changed fields per movie id.
+            refreshed_ids (list): Ids of all movies that were looked up.
+            fetched_at (datetime): Time of the lookups.
+
+        Returns:
+            bool: True if the refresh was written.
+        """
+        try:
+            write_movie_refresh(self.db.session, changes_by_id, refreshed_ids, fetched_at)
+            for movie_id in changes_by_id:
+                self.record_movie_change(movie_id, 'update')
+            self.commit()
+            if changes_by_id:
+                self.notify_changes()
+            return True
+
+        except Exception as e:
+            self.db.session.rollback()  # Rollback on error
+            raise_if_pool_timeout(e)
+            print(f"Database update error: {e}")
+            return False
+
+
+    def enable_incremental_vacuum(self):
+        """
+        Switches the database to ``auto_vacuum=INCREMENTAL``. Changing the mode
+        of an existing database needs one full VACUUM, which holds the write
+        lock while the whole file is rewritten, so run it while the app is
+        stopped. On a database without tables it is cheap. Does nothing once
+        the mode is incremental.
+
+        Returns:
+            bool: True if the database had to be converted.
+        """
+        if not convert_to_incremental_vacuum(self.db.engine):
+            return False
+        print("Database switched to incremental auto vacuum")
+        return True
+
+
+    def incremental_vacuum(self, pages=100):
+        """
+        Returns up to ``pages`` free pages to the file system.
+
+        Returns:
+            int: Number of free pages left afterwards.
+        """
+        return step_incremental_vacuum(self.db.engine, pages)
+
+
+    def get_storage_stats(self):
+        """
+        Reports the database file size, free pages, auto vacuum mode and per
+        table row counts.
+        Table sizes in bytes are included when SQLite has the ``dbstat``
+        virtual table compiled in.
+
+        Returns:
+            dict: Storage statistics.
+        """
+        return read_storage_stats(self.db.engine, self.db_file_name,
+                                  self.db.metadata.sorted_tables)
@@ -0,0 +1,72 @@
+"""
+Minimal in-process metrics registry.
+
+Gauges and counters are kept per worker process and exposed in the
+Prometheus text format at ``/admin/metrics``. A metric name can have several
+series told apart by labels, e.g. ``set_gauge('db_table_rows', 10,
+labels={'table': 'movies'})``.
+"""
+
+import threading
+
+lock = threading.Lock()
+metrics = {}  # name -> (type, description, {label items: value})
+
+
+def label_key(labels):
+    return tuple(sorted((labels or {}).items()))
+
+
+def get_series(name, metric_type, description):
+    """
+    Returns the series dict of a metric, registering it on first use. Must be
+    called with ``lock`` held.
+    """
+    if name not in metrics:
+        metrics[name] = (metric_type, description, {})
+    elif description and not metrics[name][1]:
+        metrics[name] = (metric_type, description, metrics[name][2])
+    return metrics[name][2]
+
+
+def set_gauge(name, value, description='', labels=None):
+    with lock:
+        get_series(name, 'gauge', description)[label_key(labels)] = value
+
+
+def inc_counter(name, amount=1, description='', labels=None):
+    with lock:
+        series = get_series(name, 'counter', description)
+        key = label_key(labels)
+        series[key] = series.get(key, 0) + amount
+
+
+def get_metric(name, default=None, labels=None):
+    with lock:
+        if name not in metrics:
+            return default
+        return metrics[name][2].get(label_key(labels), default)
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_metrics():
+    """
+    Returns all metrics in the Prometheus text exposition format, with one
+    ``HELP``/``TYPE`` header per metric name followed by all its series.
+    """
+    with lock:
+        items = sorted((name, (metric_type, description, dict(series)))
+                       for name, (metric_type, description, series) in metrics.items())
+    lines = []
+    for name, (metric_type, description, series) in items:
+        if description:
+            lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for key, value in sorted(series.items()):
+            labels = ','.join(f'{label}="{escape_label_value(label_value)}"'
+                              for label, label_value in key)
+            lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+    return '\n'.join(lines) + '\n'
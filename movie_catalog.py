@@ -0,0 +1,350 @@
+"""
+Local movie catalog with fuzzy, typo-tolerant title lookup.
+
+The catalog is a small SQLite database filled from bulk dump files (TSV or
+JSON) and from every successful OMDb lookup. Titles are indexed in memory by
+character trigrams, so a slightly misspelled title still finds its movie
+without a network round trip to OMDb.
+
+Load a dump with:
+
+    python movie_catalog.py load movies.tsv
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from contextlib import contextmanager
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    "data", "movie_catalog.sqlite")
+
+# Column names accepted in dump files, mapped to our movie info keys
+FIELD_ALIASES = {
+    'title': ('title', 'Title', 'primaryTitle'),
+    'year': ('year', 'Year', 'startYear'),
+    'rating': ('rating', 'imdbRating', 'averageRating'),
+    'poster': ('poster', 'Poster'),
+    'director': ('director', 'Director', 'directors'),
+}
+MISSING_VALUES = {'', 'N/A', '\\N'}
+LOAD_BATCH_SIZE = 5000
+
+
+def normalize_title(title):
+    """
+    Lowercases a title, strips accents and punctuation and collapses spaces.
+    """
+    title = unicodedata.normalize('NFKD', title)
+    title = ''.join(char for char in title if not unicodedata.combining(char))
+    return ' '.join(re.sub(r'[^0-9a-z]+', ' ', title.lower()).split())
+
+
+def trigrams(title):
+    """
+    Returns the set of character trigrams of a title. Each word is padded
+    like ``pg_trgm`` does, so short words and word starts still match.
+    """
+    grams = set()
+    for word in normalize_title(title).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def clean_value(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return None if value in MISSING_VALUES else value
+
+
+def parse_record(record):
+    """
+    Maps a dump record onto the movie info dict used by ``omdbapi``.
+
+    Returns:
+        dict: Movie info, or None if the record has no title.
+    """
+    movie = {}
+    for field, aliases in FIELD_ALIASES.items():
+        movie[field] = next((clean_value(record[alias]) for alias in aliases
+                             if alias in record), None)
+    if not movie['title']:
+        return None
+    try:
+        movie['rating'] = float(movie['rating']) if movie['rating'] else None
+    except ValueError:
+        movie['rating'] = None
+    return movie
+
+
+def read_dump(path):
+    """
+    Yields movie info dicts from a ``.tsv``, ``.json`` or ``.jsonl`` dump.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding='utf-8', newline='') as file:
+        if extension == '.tsv':
+            records = csv.DictReader(file, delimiter='\t', quoting=csv.QUOTE_NONE)
+        elif extension == '.jsonl':
+            records = (json.loads(line) for line in file if line.strip())
+        elif extension == '.json':
+            records = json.load(file)
+        else:
+            raise ValueError(f"Unsupported dump format: {extension}")
+
+        for record in records:
+            movie = parse_record(record)
+            if movie:
+                yield movie
+
+
+def movie_info(entry):
+    return {
+        'catalog_id': entry['id'],
+        'title': entry['title'],
+        'year': entry['year'] or '0',
+        'rating': entry['rating'] if entry['rating'] is not None else 0.0,
+        'poster': entry['poster'],
+        'director': entry['director'] or 'Unknown Director',
+    }
+
+
+
+
+class MovieCatalog:
+    """
+    Persistent movie catalog with an in-memory trigram index.
+
+    The index is built on first use, so creating a catalog is cheap and the
+    database file is only opened when the catalog is actually queried.
+    """
+
+    def __init__(self, db_path=DEFAULT_CATALOG_PATH):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.entries = None
+        self.entry_trigrams = {}
+        self.index = {}
+
+
+    @contextmanager
+    def connect(self):
+        """
+        Opens the catalog database in a transaction, creating the table on
+        first use.
+        """
+        connection = sqlite3.connect(self.db_path)
+        connection.row_factory = sqlite3.Row
+        try:
+            with connection:
+                connection.execute("""
+                CREATE TABLE IF NOT EXISTS catalog (
+                    id INTEGER PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    normalized_title TEXT NOT NULL,
+                    year TEXT NOT NULL DEFAULT '',
+                    rating REAL,
+                    poster TEXT,
+                    director TEXT,
+                    UNIQUE (normalized_title, year)
+                )""")
+                yield connection
+        finally:
+            connection.close()
+
+
+    def upsert(self, connection, movies):
+        connection.executemany("""
+            INSERT INTO catalog (title, normalized_title, year, rating, poster, director)
+            VALUES (:title, :normalized_title, :year, :rating, :poster, :director)
+            ON CONFLICT (normalized_title, year) DO UPDATE SET
+                title = excluded.title,
+                rating = COALESCE(excluded.rating, rating),
+                poster = COALESCE(excluded.poster, poster),
+                director = COALESCE(excluded.director, director)
+            """, [{'title': movie['title'],
+                  'normalized_title': normalize_title(movie['title']),
+                  'year': movie.get('year') or '',
+                  'rating': movie.get('rating'),
+                  'poster': movie.get('poster'),
+                  'director': movie.get('director')} for movie in movies])
+
+
+    def index_entry(self, entry):
+        for gram in self.entry_trigrams.get(entry['id'], ()):
+            self.index[gram].discard(entry['id'])
+        grams = trigrams(entry['title'])
+        self.entries[entry['id']] = entry
+        self.entry_trigrams[entry['id']] = grams
+        for gram in grams:
+            self.index.setdefault(gram, set()).add(entry['id'])
+
+
+    def ensure_index(self):
+        """
+        Loads every catalog entry and builds the trigram index. Must be called
+        with ``self.lock`` held.
+        """
+        if self.entries is not None:
+            return
+        self.entries, self.entry_trigrams, self.index = {}, {}, {}
+        with self.connect() as connection:
+            for row in connection.execute(
+                    "SELECT id, title, year, rating, poster, director FROM catalog"):
+                self.index_entry(dict(row))
+
+
+    def add(self, movie):
+        """
+        Stores a movie info dict, e.g. a successful ``omdbapi.get_movie_info``
+        result, and makes it searchable immediately.
+        """
+        if not movie or not movie.get('title'):
+            return
+        with self.lock:
+            with self.connect() as connection:
+                self.upsert(connection, [movie])
+                row = connection.execute(
+                    "SELECT id, title, year, rating, poster, director FROM catalog "
+                    "WHERE normalized_title = ? AND year = ?",
+                    (normalize_title(movie['title']), movie.get('year') or '')).fetchone()
+            if self.entries is not None:
+                self.index_entry(dict(row))
+
+
+    def load_dump(self, path):
+        """
+        Bulk loads a TSV/JSON dump into the catalog.
+
+        Args:
+            path (str): Path to a ``.tsv``, ``.json`` or ``.jsonl`` file.
+
+        Returns:
+            int: Number of movies read from the dump.
+        """
+        count = 0
+        batch = []
+        with self.lock:
+            with self.connect() as connection:
+                for movie in read_dump(path):
+                    batch.append(movie)
+                    if len(batch) >= LOAD_BATCH_SIZE:
+                        self.upsert(connection, batch)
+                        count += len(batch)
+                        batch = []
+                self.upsert(connection, batch)
+                count += len(batch)
+            # Rebuild lazily on the next search
+            self.entries = None
+        return count
+
+
+    def search(self, title, limit=5, min_score=0.3, year=None):
+        """
+        Finds the catalog entries whose titles are most similar to ``title``.
+
+        Similarity is the Dice coefficient of the two trigram sets. Only the
+        rarest query trigrams are used to collect candidates: any entry that
+        shares none of them cannot reach ``min_score``.
+
+        Args:
+            title (str): User-typed title.
+            limit (int): Maximum number of matches to return.
+            min_score (float): Minimum similarity between 0 and 1.
+            year (str): Optional release year the matches must have.
+
+        Returns:
+            list: ``(score, movie)`` tuples, best match first.
+        """
+        query = trigrams(title or '')
+        if not query:
+            return []
+
+        with self.lock:
+            self.ensure_index()
+            required_overlap = max(1, math.ceil(min_score * len(query) / 2))
+            rarest_first = sorted(query, key=lambda gram: len(self.index.get(gram, ())))
+            candidates = set()
+            for gram in rarest_first[:len(query) - required_overlap + 1]:
+                candidates.update(self.index.get(gram, ()))
+
+            matches = []
+            for entry_id in candidates:
+                entry = self.entries[entry_id]
+                if year and (entry['year'] or '0') != str(year):
+                    continue
+                grams = self.entry_trigrams[entry_id]
+                score = 2 * len(query & grams) / (len(query) + len(grams))
+                if score >= min_score:
+                    matches.append((score, entry))
+
+        matches.sort(key=lambda match: (match[0], match[1]['rating'] or 0), reverse=True)
+        return [(score, movie_info(entry)) for score, entry in matches[:limit]]
+
+
+    def lookup(self, title, min_score=0.6, margin=0.15, year=None):
+        """
+        Returns the best matching movie if it is a confident match.
+
+        A match is confident when it scores at least ``min_score`` and beats
+        the runner-up by ``margin``, so "The Matrix" does not silently resolve
+        to "The Matrix Reloaded".
+
+        Returns:
+            dict: Movie info in the ``omdbapi.get_movie_info`` format.
+            None: If there is no confident match.
+        """
+        matches = self.search(title, limit=2, min_score=min_score, year=year)
+        if not matches:
+            return None
+        runner_up_score = matches[1][0] if len(matches) > 1 else 0
+        if matches[0][0] - runner_up_score < margin:
+            return None
+        return matches[0][1]
+
+
+    def get(self, catalog_id):
+        """
+        Returns the movie with the given catalog id, e.g. a suggestion the
+        user picked, without matching its title again.
+
+        Returns:
+            dict: Movie info in the ``omdbapi.get_movie_info`` format.
+            None: If there is no such entry.
+        """
+        with self.lock:
+            self.ensure_index()
+            entry = self.entries.get(catalog_id)
+        return movie_info(entry) if entry else None
+
+
+    def __len__(self):
+        with self.lock:
+            self.ensure_index()
+            return len(self.entries)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local movie catalog tools")
+    parser.add_argument('--db', default=DEFAULT_CATALOG_PATH, help="catalog database path")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    load_parser = subparsers.add_parser('load', help="bulk load a TSV/JSON dump")
+    load_parser.add_argument('dump')
+    search_parser = subparsers.add_parser('search', help="fuzzy search the catalog")
+    search_parser.add_argument('title')
+    args = parser.parse_args()
+
+    catalog = MovieCatalog(args.db)
+    if args.command == 'load':
+        print(f"Loaded {catalog.load_dump(args.dump)} movies into {args.db}")
+    elif args.command == 'search':
+        for score, movie in catalog.search(args.title):
+            print(f"{score:.2f}  {movie['title']} ({movie['year']})")
@@ -10,6 +10,7 @@ API_KEY = os.getenv("API_KEY")
 
 # Constants
 BASE_URL = "http://www.omdbapi.com/"  # Base URL for OMDB API
+REQUEST_TIMEOUT = 10  # Seconds, keeps worker threads from hanging on OMDB
 
 
 def safe_get(data, key, default=None):
@@ -20,12 +21,13 @@ def safe_get(data, key, default=None):
     return default if value == "N/A" else value
 
 
-def get_movie_info(title):
+def get_movie_info(title, year=None):
     """
     Fetches movie information from the OMDB API based on the given title.
 
     Args:
         title (str): Title of the movie to search for.
+        year (str): Optional release year to disambiguate remakes.
 
     Returns:
         dict: A dictionary containing movie details with keys:
@@ -40,10 +42,12 @@ def get_movie_info(title):
         "t": title.strip(),
         "apikey": API_KEY
     }
+    if year:
+        params["y"] = year
 
     try:
         # Make the request
-        response = requests.get(BASE_URL, params=params)
+        response = requests.get(BASE_URL, params=params, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()  # Raise an exception for HTTP errors
 
         # Parse the JSON response
@@ -0,0 +1,272 @@
+"""
+On-demand request profiling.
+
+A request is profiled when any of these is true:
+
+* it carries an ``X-Profile`` header equal to the ``ADMIN_TOKEN``,
+* it is picked by ``PROFILE_SAMPLE_RATE`` (0.0 - 1.0),
+* profiling was switched on through ``/admin/profiling`` (per worker process).
+
+A profiled request is sampled by a background thread that records the
+request thread's call stack every ``PROFILE_INTERVAL`` seconds, and
+``tracemalloc`` tracks its allocations. Two files are written per request to
+``PROFILE_DIR``: a collapsed-stack ``.folded`` file that can be fed directly to
+flamegraph.pl or speedscope, and an ``.alloc.txt`` report of the top
+allocation sites. ``tracemalloc`` is process-wide, so the allocation report
+also counts allocations of concurrent requests. When profiling is off, the
+only cost per request is a couple of attribute and dict lookups.
+"""
+
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request
+
+PROFILE_EXTENSIONS = ('.folded', '.alloc.txt')
+TRACEMALLOC_FRAMES = 10
+
+
+class ProfilingState:
+    """
+    Admin toggle for profiling every request of this worker for a while.
+    """
+
+    def __init__(self):
+        self.enabled_until = 0.0
+
+
+    @property
+    def enabled(self):
+        return self.enabled_until > time.monotonic()
+
+
+    def enable(self, seconds):
+        self.enabled_until = time.monotonic() + seconds
+
+
+    def disable(self):
+        self.enabled_until = 0.0
+
+
+def frame_name(frame):
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f"{os.path.basename(code.co_filename)}:{name}".replace(';', ':')
+
+
+def collapse_stack(frame):
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler(threading.Thread):
+    """
+    Periodically records the call stack of one thread.
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name=f"profiler-{thread_id}", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class AllocationTracker:
+    """
+    Shares ``tracemalloc`` between concurrently profiled requests. Tracing is
+    started by the first request and stopped again after the last one.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0
+        self.started_tracing = False
+
+
+    def start(self):
+        """
+        Returns a baseline snapshot if tracing was already running, else None.
+        """
+        with self.lock:
+            self.users += 1
+            if tracemalloc.is_tracing():
+                return tracemalloc.take_snapshot()
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.started_tracing = True
+            return None
+
+
+    def stop(self, baseline, top):
+        with self.lock:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            self.users -= 1
+            if self.users == 0 and self.started_tracing:
+                tracemalloc.stop()
+                self.started_tracing = False
+
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        if baseline is not None:
+            stats = snapshot.compare_to(baseline, 'lineno')[:top]
+            lines = [str(stat) for stat in stats]
+        else:
+            lines = [str(stat) for stat in snapshot.statistics('lineno')[:top]]
+        return peak, lines
+
+
+allocation_tracker = AllocationTracker()
+
+
+class RequestProfile:
+    def __init__(self, endpoint, interval):
+        self.id = f"{datetime.now():%Y%m%d-%H%M%S}-{endpoint}-{uuid.uuid4().hex[:8]}"
+        self.started = time.perf_counter()
+        self.sampler = StackSampler(threading.get_ident(), interval)
+        self.baseline = allocation_tracker.start()
+        self.sampler.start()
+
+
+    def finish(self, profile_dir, top_allocations):
+        self.sampler.stop()
+        duration = time.perf_counter() - self.started
+        peak, allocation_lines = allocation_tracker.stop(self.baseline, top_allocations)
+
+        os.makedirs(profile_dir, exist_ok=True)
+        base_path = os.path.join(profile_dir, self.id)
+        with open(base_path + '.folded', 'w') as file:
+            for stack, count in self.sampler.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+        with open(base_path + '.alloc.txt', 'w') as file:
+            file.write(f"{request.method} {request.path}\n")
+            file.write(f"Duration: {duration * 1000:.1f} ms\n")
+            file.write(f"Samples: {sum(self.sampler.stacks.values())}\n")
+            file.write(f"Peak traced memory: {peak / 1024:.1f} KiB\n\n")
+            # tracemalloc cannot tell threads apart
+            file.write("Allocations are traced process-wide and include other requests "
+                       "handled while this one ran.\n")
+            file.write(f"Top {top_allocations} allocation sites:\n")
+            file.write('\n'.join(allocation_lines) + '\n')
+
+
+def list_profiles(profile_dir, endpoint=None, limit=50):
+    """
+    Returns the most recent profiles, newest first.
+
+    Returns:
+        list: Dicts with the profile ``id``, ``endpoint``, ``created`` time
+        and the file names that can be downloaded.
+    """
+    if not os.path.isdir(profile_dir):
+        return []
+    profiles = {}
+    for name in os.listdir(profile_dir):
+        for extension in PROFILE_EXTENSIONS:
+            if name.endswith(extension):
+                profile_id = name[:-len(extension)]
+                profiles.setdefault(profile_id, []).append(name)
+
+    result = []
+    for profile_id in sorted(profiles, reverse=True):
+        profile_endpoint = profile_id.split('-', 2)[2].rsplit('-', 1)[0]
+        if endpoint and profile_endpoint != endpoint:
+            continue
+        result.append({
+            "id": profile_id,
+            "endpoint": profile_endpoint,
+            "created": datetime.strptime(profile_id[:15], '%Y%m%d-%H%M%S').isoformat(),
+            "files": sorted(profiles[profile_id]),
+        })
+        if len(result) >= limit:
+            break
+    return result
+
+
+def prune_profiles(profile_dir, keep):
+    profile_ids = sorted({profile['id'] for profile in list_profiles(profile_dir, limit=sys.maxsize)},
+                         reverse=True)
+    for profile_id in profile_ids[keep:]:
+        for extension in PROFILE_EXTENSIONS:
+            path = os.path.join(profile_dir, profile_id + extension)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def init_profiling(app, profile_dir):
+    """
+    Registers the profiling hooks.
+
+    Config:
+        PROFILE_SAMPLE_RATE (float): Fraction of requests to profile.
+        PROFILE_INTERVAL (float): Seconds between stack samples.
+        PROFILE_TOP_ALLOCATIONS (int): Allocation sites per report.
+        PROFILE_MAX_FILES (int): Profiles kept before the oldest are removed.
+    """
+    app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+    app.config.setdefault('PROFILE_INTERVAL', 0.005)
+    app.config.setdefault('PROFILE_TOP_ALLOCATIONS', 25)
+    app.config.setdefault('PROFILE_MAX_FILES', 200)
+    app.config['PROFILE_DIR'] = profile_dir
+    state = ProfilingState()
+    app.extensions['profiling'] = state
+
+    def should_profile():
+        if state.enabled:
+            return True
+        token = request.headers.get('X-Profile')
+        if token is not None:
+            expected = app.config.get('ADMIN_TOKEN')
+            return bool(expected) and hmac.compare_digest(token.encode(), expected.encode())
+        rate = app.config['PROFILE_SAMPLE_RATE']
+        return bool(rate) and random.random() < rate
+
+    @app.before_request
+    def start_profile():
+        if request.blueprint == 'admin' or not should_profile():
+            return
+        g.request_profile = RequestProfile(request.endpoint or 'unknown',
+                                           app.config['PROFILE_INTERVAL'])
+
+    @app.after_request
+    def add_profile_header(response):
+        profile = g.get('request_profile')
+        if profile is not None:
+            response.headers['X-Profile-Id'] = profile.id
+        return response
+
+    @app.teardown_request
+    def finish_profile(exception):
+        profile = g.pop('request_profile', None)
+        if profile is None:
+            return
+        try:
+            profile.finish(profile_dir, app.config['PROFILE_TOP_ALLOCATIONS'])
+            prune_profiles(profile_dir, app.config['PROFILE_MAX_FILES'])
+        except Exception as e:
+            app.logger.error(f"Could not write profile {profile.id}: {e}")
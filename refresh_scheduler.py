@@ -0,0 +1,174 @@
+"""
+Background refresh of stale movie metadata.
+
+IMDb ratings and posters change after a movie has been added. This job picks
+the movies whose ``fetched_at`` is oldest, most popular first, re-fetches them
+from OMDb in small batches and writes back only the fields that changed.
+Every library holding a changed movie gets an ``update`` entry in the change
+log, so delta-sync clients see the new rating.
+
+OMDb calls are limited by an hourly and a daily budget. The budget counters
+live in the ``app_state`` table, so the limits survive restarts, and progress
+is implied by ``fetched_at`` itself: after a restart the job simply continues
+with whatever is stalest. Run it in a single process only.
+"""
+
+import argparse
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+import omdbapi
+from background_jobs import register_job
+from datamanager.sqlite_data_manager import utcnow, AppState
+
+REFRESHED_FIELDS = ('rating', 'poster')
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+
+def session():
+    """
+    Returns the session of the SQLAlchemy instance set up on the current app.
+    """
+    return current_app.extensions['sqlalchemy'].session
+
+
+class OmdbBudget:
+    """
+    Fixed-window request budget persisted in the ``app_state`` table.
+    """
+
+    def __init__(self, hourly_limit, daily_limit, prefix='omdb_budget'):
+        self.limits = {'hour': (hourly_limit, HOUR), 'day': (daily_limit, DAY)}
+        self.prefix = prefix
+
+
+    def load_window(self, name, now):
+        start = session().get(AppState, f"{self.prefix}.{name}_start")
+        count = session().get(AppState, f"{self.prefix}.{name}_count")
+        if not start or now - datetime.fromisoformat(start.value) >= self.limits[name][1]:
+            return now, 0
+        return datetime.fromisoformat(start.value), int(count.value) if count else 0
+
+
+    def save_window(self, name, start, count):
+        session().merge(AppState(key=f"{self.prefix}.{name}_start", value=start.isoformat()))
+        session().merge(AppState(key=f"{self.prefix}.{name}_count", value=str(count)))
+
+
+    def remaining(self, now=None):
+        now = now or utcnow()
+        return min(limit - self.load_window(name, now)[1]
+                   for name, (limit, period) in self.limits.items())
+
+
+    def take(self, now=None):
+        """
+        Spends one request from the budget.
+
+        Returns:
+            bool: False if the hourly or daily budget is exhausted.
+        """
+        now = now or utcnow()
+        windows = {name: self.load_window(name, now) for name in self.limits}
+        if any(count >= self.limits[name][0] for name, (start, count) in windows.items()):
+            return False
+        for name, (start, count) in windows.items():
+            self.save_window(name, start, count + 1)
+        session().commit()
+        return True
+
+
+def changed_fields(row, movie_info):
+    changes = {}
+    for field in REFRESHED_FIELDS:
+        new_value = movie_info.get(field)
+        old_value = getattr(row, field)
+        if field == 'rating' and new_value is not None and old_value is not None:
+            if float(new_value) == float(old_value):
+                continue
+        elif new_value == old_value:
+            continue
+        if new_value is not None:
+            changes[field] = new_value
+    return changes
+
+
+def refresh_stale_movies(budget, data_manager, batch_size=10, max_age=timedelta(days=30),
+                         fetch=omdbapi.get_movie_info):
+    """
+    Refreshes one batch of stale movies within the OMDb budget.
+
+    Args:
+        budget (OmdbBudget): Request budget to spend from.
+        data_manager (DataManagerInterface): Selects the movies and writes the
+            changes together with their change log entries.
+        batch_size (int): Maximum number of movies to refresh.
+        max_age (timedelta): Movies fetched more recently are skipped.
+        fetch (callable): OMDb lookup taking ``(title, year)``.
+
+    Returns:
+        dict: Number of movies ``checked`` and ``changed``.
+    """
+    now = utcnow()
+    batch_size = min(batch_size, budget.remaining(now))
+    if batch_size <= 0:
+        return {'checked': 0, 'changed': 0}
+
+    changes_by_id = {}
+    refreshed_ids = []
+    for row in data_manager.get_refresh_batch(batch_size, now - max_age):
+        if not budget.take(now):
+            break
+        year = row.year[:4] if row.year and row.year[:4].isdigit() else None
+        movie_info = fetch(row.title, year)
+        # Failed lookups are still stamped so they rotate to the back of the queue
+        refreshed_ids.append(row.id)
+        if movie_info:
+            changes = changed_fields(row, movie_info)
+            if changes:
+                changes_by_id[row.id] = changes
+
+    data_manager.apply_movie_refresh(changes_by_id, refreshed_ids, now)
+    return {'checked': len(refreshed_ids), 'changed': len(changes_by_id)}
+
+
+def init_refresh_scheduler(app, data_manager):
+    """
+    Registers the refresh job with the app's background jobs.
+
+    Config:
+        REFRESH_INTERVAL (int): Seconds between batches.
+        REFRESH_BATCH_SIZE (int): Movies refreshed per batch.
+        REFRESH_MAX_AGE_DAYS (int): Age after which a movie is stale.
+        OMDB_HOURLY_BUDGET / OMDB_DAILY_BUDGET (int): OMDb request limits.
+    """
+    app.config.setdefault('REFRESH_INTERVAL', 300)
+    app.config.setdefault('REFRESH_BATCH_SIZE', 10)
+    app.config.setdefault('REFRESH_MAX_AGE_DAYS', 30)
+    app.config.setdefault('OMDB_HOURLY_BUDGET', 50)
+    app.config.setdefault('OMDB_DAILY_BUDGET', 500)
+
+    def run_refresh():
+        budget = OmdbBudget(app.config['OMDB_HOURLY_BUDGET'], app.config['OMDB_DAILY_BUDGET'])
+        result = refresh_stale_movies(budget, data_manager, app.config['REFRESH_BATCH_SIZE'],
+                                      timedelta(days=app.config['REFRESH_MAX_AGE_DAYS']))
+        if result['checked']:
+            app.logger.info(f"Refreshed {result['checked']} movies, {result['changed']} changed")
+
+    return register_job(app, 'movie-refresh', app.config['REFRESH_INTERVAL'], run_refresh)
+
+
+if __name__ == '__main__':
+    from app_setup import app, data_manager
+
+    parser = argparse.ArgumentParser(description="Refresh stale movie metadata from OMDb")
+    parser.add_argument('--batch-size', type=int, default=10)
+    args = parser.parse_args()
+
+    with app.app_context():
+        budget = OmdbBudget(app.config.get('OMDB_HOURLY_BUDGET', 50),
+                            app.config.get('OMDB_DAILY_BUDGET', 500))
+        print(refresh_stale_movies(budget, data_manager, args.batch_size,
+                                   timedelta(days=app.config.get('REFRESH_MAX_AGE_DAYS', 30))))
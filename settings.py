@@ -0,0 +1,23 @@
+"""
+File locations used by the application.
+
+Importing this module has no side effects, so command line tools can use the
+paths without setting up the Flask app.
+"""
+
+import os
+
+MAIN_FOLDER_PATH = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(MAIN_FOLDER_PATH, "data")
+
+# MOVIEWEB_DB_PATH points the app at another database, e.g. a scratch file in tests
+DB_PATH = os.getenv("MOVIEWEB_DB_PATH", os.path.join(DATA_DIR, "moviwebapp.sqlite"))
+CATALOG_PATH = os.path.join(DATA_DIR, "movie_catalog.sqlite")
+LIMITER_PATH = os.path.join(DATA_DIR, "limiter.sqlite")
+PROFILE_DIR = os.path.join(DATA_DIR, "profiles")
+BACKUP_DIR = os.path.join(DATA_DIR, "backups")
+
+# MOVIEWEB_SHARDS=N splits users and libraries over N SQLite files in SHARD_DIR
+# instead of using DB_PATH; 0 keeps the single file
+SHARD_COUNT = int(os.getenv("MOVIEWEB_SHARDS", "0"))
+SHARD_DIR = os.getenv("MOVIEWEB_SHARD_DIR", os.path.join(DATA_DIR, "shards"))
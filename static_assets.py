@@ -0,0 +1,118 @@
+"""
+Fingerprinted, precompressed static assets.
+
+At startup every file in the static folder is copied to ``static/dist`` under
+a content-hashed name (``movies_style.css`` -> ``movies_style.1a2b3c4d5e6f.css``)
+together with ``.gz`` and, when ``brotli`` is installed, ``.br`` variants.
+``url_for('static', filename=...)`` transparently returns the fingerprinted
+name, and those URLs are served with ``Cache-Control: immutable`` so browsers
+never revalidate them. Changing a file changes its URL.
+"""
+
+import hashlib
+import mimetypes
+import os
+
+from flask import request, send_from_directory
+
+from compression import brotli, compress, negotiate_encoding
+
+DIST_DIR_NAME = "dist"
+HASH_LENGTH = 12
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+PRECOMPRESSED_EXTENSIONS = {'.css', '.js', '.svg', '.html', '.txt', '.json'}
+ENCODING_SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+
+
+def fingerprint_name(filename, content):
+    root, extension = os.path.splitext(filename)
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    return f"{root}.{digest}{extension}"
+
+
+def write_atomic(path, content):
+    """
+    Writes a file via a temporary name so concurrently starting workers never
+    serve a half-written asset.
+    """
+    if os.path.exists(path):
+        return
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(content)
+    os.replace(temp_path, path)
+
+
+def build_static_assets(static_folder):
+    """
+    Copies and precompresses every static file into the dist directory.
+
+    Args:
+        static_folder (str): The app's static folder.
+
+    Returns:
+        dict: Maps each original filename to its fingerprinted name.
+    """
+    dist_dir = os.path.join(static_folder, DIST_DIR_NAME)
+    manifest = {}
+
+    for directory, subdirectories, filenames in os.walk(static_folder):
+        if os.path.abspath(directory) == os.path.abspath(static_folder):
+            subdirectories[:] = [name for name in subdirectories if name != DIST_DIR_NAME]
+        for name in filenames:
+            source = os.path.join(directory, name)
+            filename = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as file:
+                content = file.read()
+
+            fingerprinted = fingerprint_name(filename, content)
+            target = os.path.join(dist_dir, *fingerprinted.split('/'))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            write_atomic(target, content)
+
+            if os.path.splitext(name)[1] in PRECOMPRESSED_EXTENSIONS:
+                write_atomic(target + ENCODING_SUFFIXES['gzip'], compress(content, 'gzip', 9))
+                if brotli:
+                    write_atomic(target + ENCODING_SUFFIXES['br'], compress(content, 'br', 11))
+
+            manifest[filename] = fingerprinted
+
+    return manifest
+
+
+def init_static_assets(app):
+    """
+    Builds the fingerprinted assets and wires them into ``url_for`` and the
+    ``static`` endpoint.
+    """
+    manifest = build_static_assets(app.static_folder)
+    fingerprinted_names = set(manifest.values())
+    dist_dir = os.path.join(app.static_folder, DIST_DIR_NAME)
+    app.extensions['static_assets'] = manifest
+
+    @app.url_defaults
+    def add_static_fingerprint(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    def serve_static(filename):
+        if filename not in fingerprinted_names:
+            return app.send_static_file(filename)
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding = negotiate_encoding(request.accept_encodings)
+        served_name = filename
+        if encoding and os.path.exists(os.path.join(dist_dir, filename + ENCODING_SUFFIXES[encoding])):
+            served_name = filename + ENCODING_SUFFIXES[encoding]
+        else:
+            encoding = None
+
+        response = send_from_directory(dist_dir, served_name, mimetype=mimetype,
+                                       max_age=IMMUTABLE_MAX_AGE)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+        return response
+
+    app.view_functions['static'] = serve_static
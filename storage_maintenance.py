@@ -0,0 +1,114 @@
+"""
+Storage maintenance: orphaned movie collection and incremental vacuum.
+
+Removing a movie from a user's library leaves the ``movies`` row behind. This
+job deletes movies no library references anymore, in small batches, and then
+hands the freed pages back to the file system with ``incremental_vacuum``
+steps. That needs the database in incremental auto vacuum mode: new
+databases are created in it, older ones are converted once, offline, with
+``python storage_maintenance.py --enable-incremental-vacuum``. The job only
+runs while this worker has been idle for a while, and stops vacuuming as soon
+as a request comes in.
+Table and file sizes before and after each run are logged and exported as
+metrics.
+"""
+
+import argparse
+from datetime import timedelta
+
+from background_jobs import register_job, track_activity
+from datamanager.sqlite_data_manager import utcnow, AUTO_VACUUM_INCREMENTAL
+from metrics import inc_counter, set_gauge
+
+
+def report_storage(app, stats, label):
+    tables = ', '.join(f"{name}={table['rows']} rows"
+                       + (f"/{table['bytes']} bytes" if 'bytes' in table else '')
+                       for name, table in stats['tables'].items())
+    app.logger.info(f"Storage {label}: file={stats['file_size']} bytes, "
+                    f"free pages={stats['freelist_count']}, {tables}")
+    set_gauge('db_file_size_bytes', stats['file_size'], "Size of the database file")
+    set_gauge('db_freelist_pages', stats['freelist_count'], "Unused pages in the database file")
+    for name, table in stats['tables'].items():
+        set_gauge('db_table_rows', table['rows'], "Rows per table", labels={'table': name})
+        if 'bytes' in table:
+            set_gauge('db_table_bytes', table['bytes'], "Bytes per table, including indexes",
+                      labels={'table': name})
+
+
+def run_storage_maintenance(app, data_manager, activity):
+    """
+    Collects orphaned movies and vacuums incrementally while the app is idle.
+
+    Returns:
+        dict: Movies ``deleted`` and ``pages_freed``, or None if the app was
+        busy.
+    """
+    config = app.config
+    if not activity.is_idle(config['STORAGE_IDLE_SECONDS']):
+        return None
+
+    before = data_manager.get_storage_stats()
+    report_storage(app, before, 'before maintenance')
+
+    deleted = data_manager.collect_orphaned_movies(
+        utcnow() - timedelta(seconds=config['ORPHAN_GRACE_SECONDS']),
+        batch_size=config['ORPHAN_BATCH_SIZE'])
+    inc_counter('gc_orphaned_movies_deleted_total', deleted, "Orphaned movies deleted")
+
+    if before['auto_vacuum'] != AUTO_VACUUM_INCREMENTAL:
+        # Converting needs a full VACUUM, which is left to the command line below
+        app.logger.warning("Database is not in incremental auto vacuum mode, free pages are "
+                           "not returned to the file system; run `python storage_maintenance.py "
+                           "--enable-incremental-vacuum` while the app is stopped")
+    else:
+        free_pages = data_manager.get_storage_stats()['freelist_count']
+        while free_pages and activity.is_idle(config['STORAGE_IDLE_SECONDS']):
+            remaining = data_manager.incremental_vacuum(config['VACUUM_PAGES_PER_STEP'])
+            if remaining >= free_pages:
+                break
+            free_pages = remaining
+
+    after = data_manager.get_storage_stats()
+    report_storage(app, after, 'after maintenance')
+    return {'deleted': deleted, 'pages_freed': before['page_count'] - after['page_count']}
+
+
+def init_storage_maintenance(app, data_manager):
+    """
+    Registers the maintenance job with the app's background jobs.
+
+    Config:
+        STORAGE_MAINTENANCE_INTERVAL (int): Seconds between runs.
+        STORAGE_IDLE_SECONDS (int): Quiet time required before running.
+        ORPHAN_GRACE_SECONDS (int): Minimum age of an orphaned movie.
+        ORPHAN_BATCH_SIZE (int): Movies deleted per transaction.
+        VACUUM_PAGES_PER_STEP (int): Pages freed per incremental vacuum step.
+    """
+    app.config.setdefault('STORAGE_MAINTENANCE_INTERVAL', 10 * 60)
+    app.config.setdefault('STORAGE_IDLE_SECONDS', 30)
+    app.config.setdefault('ORPHAN_GRACE_SECONDS', 60 * 60)
+    app.config.setdefault('ORPHAN_BATCH_SIZE', 100)
+    app.config.setdefault('VACUUM_PAGES_PER_STEP', 64)
+    # Open event streams should not keep the job from ever running
+    activity = track_activity(app, ignored_endpoints={'api.stream_user_changes'})
+
+    return register_job(app, 'storage-maintenance', app.config['STORAGE_MAINTENANCE_INTERVAL'],
+                        lambda: run_storage_maintenance(app, data_manager, activity))
+
+
+if __name__ == '__main__':
+    from app_setup import app, data_manager
+
+    parser = argparse.ArgumentParser(description="Run storage maintenance on the MovieWeb database")
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help="switch the database to incremental auto vacuum with one full "
+                             "VACUUM; stop the app first")
+    args = parser.parse_args()
+
+    if not args.enable_incremental_vacuum:
+        parser.print_help()
+    else:
+        with app.app_context():
+            converted = data_manager.enable_incremental_vacuum()
+        print("Database converted" if converted else "Database already uses incremental auto vacuum")
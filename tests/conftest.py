@@ -0,0 +1,43 @@
+import os
+import tempfile
+import pytest
+from flask import Flask
+
+# app_setup migrates the database it opens on import; keep the tests away from
+# the committed data/moviwebapp.sqlite
+os.environ.setdefault('MOVIEWEB_DB_PATH',
+                      os.path.join(tempfile.mkdtemp(prefix='moviweb-tests-'), 'moviwebapp.sqlite'))
+
+from ..datamanager.sqlite_data_manager import SQLiteDataManager, User, Movie, UserMovieLibrary
+
+
+@pytest.fixture
+def sqlite_app(tmp_path):
+    """
+    Flask app with a SQLiteDataManager on a scratch database, available as
+    ``app.extensions['data_manager']``.
+    """
+    db_path = tmp_path / "test.sqlite"
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
+    manager = SQLiteDataManager(str(db_path))
+    manager.db.init_app(app)
+    app.extensions['data_manager'] = manager
+    with app.app_context():
+        manager.migrate_schema()
+    return app
+
+
+@pytest.fixture
+def data_manager(sqlite_app):
+    with sqlite_app.app_context():
+        yield sqlite_app.extensions['data_manager']
+
+
+def add_user_with_movie(manager, name, title):
+    user = User(name=name)
+    manager.add_user(user)
+    movie = Movie(title=title, director="Someone", year="1999", rating=7, poster="p.jpg")
+    manager.add_movie(movie)
+    manager.add_user_movie_relationship(UserMovieLibrary(user_id=user.id, movie_id=movie.id))
+    return user, movie
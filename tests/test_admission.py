@@ -0,0 +1,72 @@
+import pytest
+from flask import Flask
+from ..admission import LimiterStore, init_admission_control, omdb_slot, rate_limited
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LimiterStore(str(tmp_path / "limiter.sqlite"), clock=FakeClock())
+
+
+def test_token_bucket_refills_over_time(store):
+    assert store.take_token("k", 2, 10) == 0
+    assert store.take_token("k", 2, 10) == 0
+    assert store.take_token("k", 2, 10) == pytest.approx(5)
+    store.clock.now += 5
+    assert store.take_token("k", 2, 10) == 0
+    assert store.take_token("other", 2, 10) == 0
+
+
+def test_slots_are_capped_and_leases_expire(store):
+    first = store.acquire_slot("omdb", 2, 30)
+    assert store.acquire_slot("omdb", 2, 30)
+    assert store.acquire_slot("omdb", 2, 30) is None
+    store.release_slot(first)
+    assert store.acquire_slot("omdb", 2, 30)
+    store.clock.now += 31
+    assert store.acquire_slot("omdb", 2, 30)
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    init_admission_control(app, str(tmp_path / "limiter.sqlite"))
+    app.config['RATE_LIMITS'] = {'add': {'per_client': (5, 60), 'per_user': (1, 60)}}
+    app.config['OMDB_MAX_CONCURRENCY'] = 0
+
+    @app.route('/users/<int:user_id>/add', methods=['GET', 'POST'])
+    @rate_limited('add')
+    def add(user_id):
+        return "ok"
+
+    @app.route('/lookup')
+    def lookup():
+        with omdb_slot():
+            return "looked up"
+
+    return app
+
+
+def test_rate_limited_route_returns_429_with_retry_after(app):
+    client = app.test_client()
+    assert client.post('/users/1/add').status_code == 200
+    response = client.post('/users/1/add')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+    # Other users and read requests are not affected
+    assert client.post('/users/2/add').status_code == 200
+    assert client.get('/users/1/add').status_code == 200
+
+
+def test_saturated_omdb_returns_503(app):
+    response = app.test_client().get('/lookup')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
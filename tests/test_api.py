@@ -0,0 +1,90 @@
+import queue
+import threading
+import pytest
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from datetime import timedelta
+from ..app import app, data_manager, User, Movie, UserMovieLibrary
+from ..refresh_scheduler import OmdbBudget, refresh_stale_movies, utcnow
+
+
+@pytest.fixture
+def client():
+    with app.test_client() as client:
+        yield client
+
+
+def test_change_stream_rejects_compacted_resume_point(client, monkeypatch):
+    """Resuming the stream from before the horizon asks for a full reload like /changes."""
+    monkeypatch.setattr(data_manager, 'get_change_horizon', lambda user_id=None: 10)
+    response = client.get('/api/users/1/changes/stream', headers={'Last-Event-ID': '3'})
+    assert response.status_code == 410
+    assert client.get('/api/users/1/changes?since=3').status_code == 410
+
+
+def test_change_limit_is_at_least_one(client):
+    response = client.get('/api/users/1/changes?limit=0')
+    assert response.status_code == 200
+    assert response.get_json()['has_more'] is False
+
+
+
+def hold_change_stream(opened, release):
+    response = app.test_client().get('/api/users/1/changes/stream', buffered=False)
+    opened.put(response.status_code)
+    release.wait(10)
+    response.close()
+
+
+def test_open_change_streams_do_not_hold_read_connections(client, monkeypatch):
+    """More open streams than read connections must not starve ordinary reads."""
+    monkeypatch.setattr(data_manager, 'read_engine', data_manager.read_engine)
+    monkeypatch.setattr(data_manager, 'read_sessions', data_manager.read_sessions)
+    data_manager.init_read_routing(app, pool_size=1, pool_timeout=0.5)
+    opened, release = queue.Queue(), threading.Event()
+    streams = [threading.Thread(target=hold_change_stream, args=(opened, release))
+               for _ in range(3)]
+    try:
+        for stream in streams:
+            stream.start()
+            assert opened.get(timeout=10) == 200
+        assert client.get('/api/users/1/movies').status_code == 200
+    finally:
+        release.set()
+        for stream in streams:
+            stream.join()
+        data_manager.read_engine.dispose()
+
+
+@pytest.mark.parametrize('error, status', [
+    (OperationalError("SELECT", {}, Exception("disk I/O error")), 500),
+    (PoolTimeoutError("pool exhausted"), 503),
+])
+def test_failed_snapshot_is_not_sent_as_empty_library(client, monkeypatch, error, status):
+    def fail(*args):
+        raise error
+    monkeypatch.setattr(data_manager, 'get_user_movie_rows', fail)
+    monkeypatch.setattr(data_manager, 'get_all_user_rows', fail)
+    response = client.get('/api/users/1/movies')
+    assert response.status_code == status
+    assert 'X-Change-Seq' not in response.headers
+    assert client.get('/api/users').status_code == status
+
+
+def test_refreshed_ratings_reach_the_change_feed(client):
+    with app.app_context():
+        user = User(name="refresh fan")
+        data_manager.add_user(user)
+        movie = Movie(title="Refreshed Classic", year="1999", rating=5.0, poster="p.jpg",
+                      director="Someone", fetched_at=utcnow() - timedelta(days=60))
+        data_manager.add_movie(movie)
+        data_manager.add_user_movie_relationship(UserMovieLibrary(user_id=user.id, movie_id=movie.id))
+        user_id, movie_id = user.id, movie.id
+        since = data_manager.get_latest_change_seq(user_id)
+
+        def fetch(title, year):
+            return {'rating': 8.1, 'poster': "p.jpg"} if title == "Refreshed Classic" else None
+        refresh_stale_movies(OmdbBudget(1000, 1000), data_manager, batch_size=100, fetch=fetch)
+
+    changes = client.get(f'/api/users/{user_id}/changes?since={since}').get_json()['changes']
+    assert [(c['op'], c['movie_id'], c['movie']['rating']) for c in changes] == \
+        [('update', movie_id, 8.1)]
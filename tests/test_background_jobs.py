@@ -0,0 +1,19 @@
+from flask import Flask
+from ..background_jobs import register_job, start_jobs_with_first_request, stop_background_jobs
+
+
+def test_jobs_start_with_the_first_request_only():
+    app = Flask(__name__)
+    app.add_url_rule('/', 'home', lambda: 'ok')
+    job = register_job(app, 'noop', 3600, lambda: None)
+    start_jobs_with_first_request(app)
+    try:
+        assert not job.is_alive()
+        client = app.test_client()
+        assert client.get('/').status_code == 200
+        assert job.is_alive()
+        # Later requests do not try to start the thread again
+        assert client.get('/').status_code == 200
+    finally:
+        stop_background_jobs(app)
+        job.join(1)
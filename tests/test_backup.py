@@ -0,0 +1,60 @@
+import os
+import sqlite3
+import pytest
+from .. import backup
+from ..backup import BackupTimeout, backup_database, get_metric
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = str(tmp_path / "source.sqlite")
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE movies (id INTEGER PRIMARY KEY, title TEXT)")
+    connection.executemany("INSERT INTO movies (title) VALUES (?)",
+                           [(f"Movie {i}" * 20,) for i in range(2000)])
+    connection.execute("DELETE FROM movies WHERE id % 2 = 0")
+    connection.commit()
+    connection.close()
+    return path
+
+
+def test_backup_copies_database_in_steps(source, tmp_path):
+    target = str(tmp_path / "backups" / "copy.sqlite")
+    result = backup_database(source, target, pages=4, sleep=0)
+
+    assert result['target'] == target and not os.path.exists(target + '.partial')
+    with sqlite3.connect(target) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM movies").fetchone()[0] == 1000
+    assert get_metric('backup_progress_ratio') == 1
+    assert get_metric('backup_last_size_bytes') == result['size']
+
+
+def test_snapshot_is_compacted_and_read_only(source, tmp_path):
+    backup = backup_database(source, str(tmp_path / "copy.sqlite"), sleep=0)
+    snapshot = backup_database(source, str(tmp_path / "snapshot.sqlite"), snapshot=True, sleep=0)
+
+    assert snapshot['size'] < backup['size']
+    assert not os.access(snapshot['target'], os.W_OK) or os.geteuid() == 0
+    assert not os.stat(snapshot['target']).st_mode & 0o222
+
+
+def test_backup_restarted_by_writes_times_out(source, tmp_path, monkeypatch):
+    """Steady writes restart the copy; the backup gives up instead of running forever."""
+    writer = sqlite3.connect(source)
+
+    def write_between_steps(status, remaining, total):
+        writer.execute("INSERT INTO movies (title) VALUES ('x')")
+        writer.commit()
+
+    monkeypatch.setattr(backup, 'report_progress', write_between_steps)
+    timeouts = get_metric('backup_timeouts_total', 0)
+    target = str(tmp_path / "copy.sqlite")
+    try:
+        with pytest.raises(BackupTimeout):
+            backup_database(source, target, pages=1, sleep=0, max_seconds=0.2)
+    finally:
+        writer.close()
+
+    assert get_metric('backup_timeouts_total') == timeouts + 1
+    assert get_metric('backup_restarts', 0) > 0
+    assert not os.path.exists(target) and not os.path.exists(target + '.partial')
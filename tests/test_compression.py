@@ -0,0 +1,67 @@
+import gzip
+import pytest
+from flask import Flask, Response, url_for
+from ..compression import init_compression
+from ..static_assets import init_static_assets
+
+
+@pytest.fixture
+def app(tmp_path):
+    static_folder = tmp_path / "static"
+    static_folder.mkdir()
+    (static_folder / "style.css").write_text("body { color: red; }\n" * 50)
+
+    app = Flask(__name__, static_folder=str(static_folder))
+    init_compression(app)
+    init_static_assets(app)
+
+    @app.route('/big')
+    def big():
+        return "x" * 2000
+
+    @app.route('/small')
+    def small():
+        return "tiny"
+
+    @app.route('/stream')
+    def stream():
+        return Response((f"chunk {i}\n" for i in range(3)), mimetype='text/plain')
+
+    return app
+
+
+def test_large_response_is_gzipped(app):
+    response = app.test_client().get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data) == b"x" * 2000
+
+
+def test_small_or_unaccepted_response_is_not_compressed(app):
+    client = app.test_client()
+    assert 'Content-Encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'Content-Encoding' not in client.get('/big').headers
+
+
+def test_streamed_response_is_compressed(app):
+    response = app.test_client().get('/stream', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == b"chunk 0\nchunk 1\nchunk 2\n"
+
+
+def test_static_url_is_fingerprinted_and_immutable(app):
+    with app.test_request_context():
+        url = url_for('static', filename='style.css')
+    assert url != '/static/style.css' and url.endswith('.css')
+
+    response = app.test_client().get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/css'
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert gzip.decompress(response.data).startswith(b"body { color: red; }")
+    response.close()
+
+    plain = app.test_client().get('/static/style.css')
+    assert plain.status_code == 200
+    plain.close()
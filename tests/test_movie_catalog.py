@@ -0,0 +1,92 @@
+import json
+import pytest
+from ..movie_catalog import MovieCatalog, normalize_title
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    dump = tmp_path / "movies.tsv"
+    dump.write_text(
+        "primaryTitle\tstartYear\taverageRating\tdirectors\n"
+        "The Matrix\t1999\t8.7\tLana Wachowski\n"
+        "The Matrix Reloaded\t2003\t7.2\t\\N\n"
+        "Amélie\t2001\t8.3\tJean-Pierre Jeunet\n"
+        "Alien\t1979\t8.5\tRidley Scott\n",
+        encoding='utf-8')
+    catalog = MovieCatalog(str(tmp_path / "catalog.sqlite"))
+    assert catalog.load_dump(str(dump)) == 4
+    return catalog
+
+
+def test_normalize_title_strips_accents_and_punctuation():
+    assert normalize_title("  Amélie: The   Movie! ") == "amelie the movie"
+
+
+def test_lookup_tolerates_typos(catalog):
+    assert catalog.lookup("the matirx")['title'] == "The Matrix"
+    assert catalog.lookup("amelie")['title'] == "Amélie"
+    assert catalog.lookup("completely unrelated") is None
+
+
+def test_search_ranks_best_match_first(catalog):
+    matches = catalog.search("matrix reloded", min_score=0.3)
+    assert [movie['title'] for score, movie in matches][:2] == ["The Matrix Reloaded", "The Matrix"]
+    assert matches[0][1]['director'] == "Unknown Director"
+
+
+def test_added_movies_are_persisted_and_searchable(catalog, tmp_path):
+    catalog.add({'title': 'Dune', 'year': '1984', 'rating': 6.3,
+                 'poster': None, 'director': 'David Lynch'})
+    assert catalog.lookup("dune", year="1984")['director'] == "David Lynch"
+    assert catalog.lookup("dune", year="2021") is None
+
+    reopened = MovieCatalog(catalog.db_path)
+    assert len(reopened) == 5
+
+
+def test_load_json_dump(tmp_path):
+    dump = tmp_path / "movies.json"
+    dump.write_text(json.dumps([{"Title": "Heat", "Year": "1995", "imdbRating": "N/A"}]))
+    catalog = MovieCatalog(str(tmp_path / "catalog.sqlite"))
+    assert catalog.load_dump(str(dump)) == 1
+    assert catalog.lookup("heat")['rating'] == 0.0
+
+
+def test_lookup_rejects_ambiguous_matches(catalog):
+    catalog.add({'title': 'The Matrix', 'year': '2099'})
+    assert catalog.lookup("the matrix") is None
+    assert catalog.lookup("the matrix", year="1999")['rating'] == 8.7
+
+
+def test_picked_suggestion_resolves_by_id(catalog):
+    """A suggestion stays selectable even when its title is ambiguous."""
+    catalog.add({'title': 'The Matrix', 'year': '2099'})
+    suggestions = catalog.search("the matrix")
+    assert catalog.lookup(suggestions[1][1]['title']) is None
+
+    picked = catalog.get(suggestions[1][1]['catalog_id'])
+    assert picked == suggestions[1][1]
+    assert catalog.get(12345) is None
+
+
+def test_add_movie_form_passes_the_year_on(catalog, monkeypatch):
+    from .. import app as app_module
+    monkeypatch.setattr(app_module, 'movie_catalog', catalog)
+    requested = []
+
+    def get_movie_info(title, year=None):
+        requested.append((title, year))
+        return None
+    monkeypatch.setattr(app_module.omdbapi, 'get_movie_info', get_movie_info)
+    with app_module.app.app_context():
+        user = app_module.User(name="dune fan")
+        app_module.data_manager.add_user(user)
+        user_id = user.id
+
+    catalog.add({'title': 'Dune', 'year': '1984', 'director': "David Lynch"})
+    client = app_module.app.test_client()
+    client.post(f'/users/{user_id}/add_movie', data={'title': "Dune", 'year': "2021"})
+    assert requested == [("Dune", "2021")]
+
+    client.post(f'/users/{user_id}/add_movie', data={'title': "Dune", 'year': " "})
+    assert requested == [("Dune", "2021")]
@@ -0,0 +1,56 @@
+import time
+import pytest
+from flask import Flask
+from ..profiling import init_profiling, list_profiles
+from ..admin import admin
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['ADMIN_TOKEN'] = 'secret'
+    init_profiling(app, str(tmp_path / "profiles"))
+    app.register_blueprint(admin, url_prefix='/admin')
+
+    @app.route('/slow')
+    def slow():
+        data = [str(i) * 10 for i in range(20000)]
+        time.sleep(0.05)
+        return str(len(data))
+
+    return app
+
+
+def test_requests_are_not_profiled_by_default(app):
+    response = app.test_client().get('/slow')
+    assert 'X-Profile-Id' not in response.headers
+    assert list_profiles(app.config['PROFILE_DIR']) == []
+
+
+def test_profile_header_writes_stacks_and_allocations(app):
+    client = app.test_client()
+    assert 'X-Profile-Id' not in client.get('/slow', headers={'X-Profile': 'wrong'}).headers
+
+    response = client.get('/slow', headers={'X-Profile': 'secret'})
+    profile_id = response.headers['X-Profile-Id']
+
+    profiles = client.get('/admin/profiles', headers={'X-Admin-Token': 'secret'}).json
+    assert [p['id'] for p in profiles] == [profile_id]
+    assert profiles[0]['endpoint'] == 'slow'
+
+    folded = client.get(f'/admin/profiles/{profile_id}.folded',
+                        headers={'X-Admin-Token': 'secret'}).get_data(as_text=True)
+    assert 'test_profiling.py:' in folded and 'slow' in folded
+    report = client.get(f'/admin/profiles/{profile_id}.alloc.txt',
+                        headers={'X-Admin-Token': 'secret'}).get_data(as_text=True)
+    assert report.startswith('GET /slow') and 'allocation sites' in report
+
+
+def test_admin_toggle_requires_token(app):
+    client = app.test_client()
+    assert client.post('/admin/profiling', json={'enabled': True}).status_code == 403
+
+    response = client.post('/admin/profiling', json={'enabled': True, 'seconds': 60},
+                           headers={'X-Admin-Token': 'secret'})
+    assert response.json['enabled'] is True
+    assert 'X-Profile-Id' in client.get('/slow').headers
@@ -0,0 +1,55 @@
+from datetime import timedelta
+from ..datamanager.sqlite_data_manager import utcnow, Movie, User, UserMovieLibrary
+from ..refresh_scheduler import OmdbBudget, refresh_stale_movies
+
+
+def add_movie(manager, title, fetched_at, users=0, rating=5.0):
+    movie = Movie(title=title, year="2000", rating=rating, poster="old.jpg", fetched_at=fetched_at)
+    manager.add_movie(movie)
+    for i in range(users):
+        user = User(name=f"{title} fan {i}")
+        manager.add_user(user)
+        manager.add_user_movie_relationship(UserMovieLibrary(user_id=user.id, movie_id=movie.id))
+    return movie
+
+
+def test_refresh_updates_only_changed_fields(data_manager):
+    old = utcnow() - timedelta(days=60)
+    changed = add_movie(data_manager, "Changed", old)
+    same = add_movie(data_manager, "Same", old)
+    fresh = add_movie(data_manager, "Fresh", utcnow())
+
+    def fetch(title, year):
+        assert year == "2000"
+        rating = 7.5 if title == "Changed" else 5.0
+        return {'title': title, 'year': year, 'rating': rating,
+                'poster': "old.jpg", 'director': "Someone"}
+
+    result = refresh_stale_movies(OmdbBudget(10, 100), data_manager, batch_size=10,
+                                  max_age=timedelta(days=30), fetch=fetch)
+    assert result == {'checked': 2, 'changed': 1}
+
+    data_manager.db.session.expire_all()
+    assert data_manager.get_movie_by_id(changed.id).rating == 7.5
+    assert data_manager.get_movie_by_id(same.id).fetched_at > old
+    assert data_manager.get_movie_by_id(fresh.id).fetched_at < utcnow()
+
+
+def test_refresh_prefers_popular_movies_and_respects_budget(data_manager):
+    old = utcnow() - timedelta(days=60)
+    add_movie(data_manager, "Niche", old, users=0)
+    add_movie(data_manager, "Popular", old, users=3)
+    fetched = []
+
+    def fetch(title, year):
+        fetched.append(title)
+        return None
+
+    budget = OmdbBudget(hourly_limit=1, daily_limit=100)
+    assert refresh_stale_movies(budget, data_manager, batch_size=5, fetch=fetch)['checked'] == 1
+    assert fetched == ["Popular"]
+
+    # The hourly budget is persisted, so a new budget object is still exhausted
+    assert refresh_stale_movies(OmdbBudget(1, 100), data_manager, batch_size=5, fetch=fetch)['checked'] == 0
+    later = utcnow() + timedelta(hours=2)
+    assert OmdbBudget(1, 100).remaining(later) == 1
@@ -0,0 +1,207 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from ..datamanager import sharded_sqlite_data_manager
+from ..datamanager.sharded_sqlite_data_manager import (ShardedSQLiteDataManager,
+                                                       rebalance_shards, shard_for)
+from ..datamanager.sqlite_data_manager import User, UserMovieLibrary
+from .conftest import add_user_with_movie
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = ShardedSQLiteDataManager(str(tmp_path), shard_count=4)
+    yield manager
+    manager.dispose()
+
+
+def test_users_are_routed_to_their_shard(manager):
+    """Each user row lives only in the shard picked by its id."""
+    users = [add_user_with_movie(manager, f"user{i}", f"Movie {i}")[0] for i in range(8)]
+    for user in users:
+        owner = shard_for(user.id, manager.shard_count)
+        with manager.shard_sessions[owner]() as session:
+            assert session.get(User, user.id) is not None
+        for index, session_factory in enumerate(manager.shard_sessions):
+            if index != owner:
+                with session_factory() as session:
+                    assert session.get(User, user.id) is None
+
+
+def test_get_all_users_merges_every_shard(manager):
+    """Fan-out reads return users from all shards ordered by id."""
+    for i in range(10):
+        manager.add_user(User(name=f"user{i}"))
+    users = manager.get_all_users()
+    assert [user.id for user in users] == list(range(1, 11))
+
+
+def test_get_user_movies_reads_shared_catalog(manager):
+    """Library rows from the shard are resolved against the movie catalog."""
+    user, movie = add_user_with_movie(manager, "alice", "Alien")
+    movies = manager.get_user_movies(user.id)
+    assert [m.title for m in movies] == ["Alien"]
+    assert manager.get_user_movie_relationship(user.id, movie.id)
+    assert manager.remove_movie_from_user(user.id, movie.id)
+    assert manager.get_user_movies(user.id) == []
+
+
+def test_row_reads_match_orm_reads(manager):
+    """The Core row reads work across shards like the single-file backend's."""
+    pairs = [add_user_with_movie(manager, f"user{i}", f"Movie {i}") for i in range(6)]
+    user, movie = pairs[0]
+
+    assert [row._asdict() for row in manager.get_all_user_rows()] == \
+        [u.to_dict() for u in manager.get_all_users()]
+    assert [row._asdict() for row in manager.get_user_movie_rows(user.id)] == \
+        [m.to_dict() for m in manager.get_user_movies(user.id)]
+    assert [(c.id, c.title) for c in manager.get_user_movie_cards(user.id)] == \
+        [(movie.id, movie.title)]
+    assert manager.get_user_movie_rows(0) == []
+
+
+def test_rebalance_preserves_data(tmp_path):
+    """Changing the shard count moves every user and library row."""
+    manager = ShardedSQLiteDataManager(str(tmp_path), shard_count=2)
+    pairs = [add_user_with_movie(manager, f"user{i}", f"Movie {i}") for i in range(12)]
+    manager.dispose()
+
+    assert rebalance_shards(str(tmp_path), 5) == 12
+
+    with pytest.raises(ValueError):
+        ShardedSQLiteDataManager(str(tmp_path), shard_count=2)
+
+    manager = ShardedSQLiteDataManager(str(tmp_path))
+    assert manager.shard_count == 5
+    assert len(manager.get_all_users()) == 12
+    for user, movie in pairs:
+        assert [m.id for m in manager.get_user_movies(user.id)] == [movie.id]
+    manager.dispose()
+
+
+def test_interrupted_rebalance_can_be_resumed(tmp_path, monkeypatch):
+    """A crash while the shard files are swapped is finished by the next run."""
+    manager = ShardedSQLiteDataManager(str(tmp_path), shard_count=3)
+    pairs = [add_user_with_movie(manager, f"user{i}", f"Movie {i}") for i in range(10)]
+    manager.dispose()
+
+    move_database = sharded_sqlite_data_manager.move_database
+    moves = []
+
+    def crash_after_two_moves(source, target):
+        if len(moves) == 2:
+            raise OSError("simulated crash")
+        moves.append(source)
+        move_database(source, target)
+
+    monkeypatch.setattr(sharded_sqlite_data_manager, 'move_database', crash_after_two_moves)
+    with pytest.raises(OSError):
+        rebalance_shards(str(tmp_path), 2)
+    monkeypatch.setattr(sharded_sqlite_data_manager, 'move_database', move_database)
+
+    with pytest.raises(ValueError):
+        ShardedSQLiteDataManager(str(tmp_path))
+    assert rebalance_shards(str(tmp_path), 2) == 0
+
+    manager = ShardedSQLiteDataManager(str(tmp_path))
+    assert manager.shard_count == 2
+    assert len(manager.get_all_users()) == 10
+    for user, movie in pairs:
+        assert [m.id for m in manager.get_user_movies(user.id)] == [movie.id]
+    manager.dispose()
+    assert sorted(os.listdir(tmp_path)) == ['catalog.sqlite', 'shard_0.sqlite', 'shard_1.sqlite']
+
+
+def test_shard_count_must_be_positive(tmp_path):
+    with pytest.raises(ValueError):
+        ShardedSQLiteDataManager(str(tmp_path), shard_count=0)
+
+
+def test_library_changes_are_logged_per_shard(tmp_path):
+    """Changes are read from the user's shard and invalidated by a rebalance."""
+    manager = ShardedSQLiteDataManager(str(tmp_path), shard_count=3)
+    user, movie = add_user_with_movie(manager, "alice", "The Matrix")
+    movie.title = "The Matrix Reloaded"
+    manager.update_movie(movie)
+    manager.remove_movie_from_user(user.id, movie.id)
+
+    changes = manager.get_library_changes(user.id)
+    assert [c.op for c in changes] == ['insert', 'update', 'delete']
+    assert {c.title for c in changes} == {"The Matrix Reloaded"}
+    latest = manager.get_latest_change_seq(user.id)
+    assert latest == changes[-1].seq
+    assert manager.get_change_horizon(user.id) == 0
+    manager.dispose()
+
+    rebalance_shards(str(tmp_path), 2)
+    manager = ShardedSQLiteDataManager(str(tmp_path))
+    assert manager.get_library_changes(user.id) == []
+    assert manager.get_change_horizon(user.id) >= latest
+    assert manager.add_user_movie_relationship(UserMovieLibrary(user_id=user.id, movie_id=movie.id))
+    assert manager.get_latest_change_seq(user.id) > manager.get_change_horizon(user.id)
+    manager.dispose()
+
+
+# app_setup reads its settings at import time, so the app is booted in a
+# separate interpreter
+SHARDED_APP_SCRIPT = """
+import json
+from datetime import timedelta
+import app as web
+from datamanager.sqlite_data_manager import Movie, UserMovieLibrary, utcnow
+from refresh_scheduler import OmdbBudget, refresh_stale_movies
+from storage_maintenance import run_storage_maintenance
+
+class IdleActivity:
+    def is_idle(self, quiet_seconds):
+        return True
+
+manager = web.data_manager
+client = web.app.test_client()
+for name in ("alice", "bob"):
+    client.post('/add_user', data={'name': name})
+users = client.get('/api/users').get_json()
+long_ago = utcnow() - timedelta(days=60)
+with web.app.app_context():
+    for user in users:
+        movie = Movie(title=user['name'] + " movie", year="1999", rating=5.0, fetched_at=long_ago)
+        manager.add_movie(movie)
+        manager.add_user_movie_relationship(UserMovieLibrary(user_id=user['id'], movie_id=movie.id))
+    manager.add_movie(Movie(title="Orphan", fetched_at=long_ago))
+    storage = run_storage_maintenance(web.app, manager, IdleActivity())
+    refresh = refresh_stale_movies(OmdbBudget(10, 10), manager,
+                                   fetch=lambda title, year: {'rating': 9.0, 'poster': None})
+    compacted = manager.compact_library_changes(utcnow() + timedelta(minutes=1))
+print(json.dumps({
+    'backend': type(manager).__name__,
+    'users': [user['name'] for user in users],
+    'movies': [client.get(f"/api/users/{user['id']}/movies").get_json() for user in users],
+    'changes': [client.get(f"/api/users/{user['id']}/changes").get_json()['changes']
+                for user in users],
+    'storage': storage, 'refresh': refresh, 'compacted': compacted,
+}))
+"""
+
+
+def test_app_boots_on_the_sharded_backend(tmp_path):
+    env = dict(os.environ, MOVIEWEB_SHARDS="2", MOVIEWEB_SHARD_DIR=str(tmp_path / "shards"),
+               MOVIEWEB_DB_PATH=str(tmp_path / "unused.sqlite"))
+    env.pop('MOVIEWEB_RUN_JOBS', None)
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", SHARDED_APP_SCRIPT], cwd=package_dir, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.splitlines()[-1])
+
+    assert report['backend'] == "ShardedSQLiteDataManager"
+    assert report['users'] == ["alice", "bob"]
+    assert [[movie['rating'] for movie in movies] for movies in report['movies']] == [[9.0], [9.0]]
+    assert report['storage']['deleted'] == 1
+    assert report['refresh'] == {'checked': 2, 'changed': 2}
+    # The insert is superseded by the refresh update and compacted away
+    assert report['compacted'] == 2
+    assert [[change['op'] for change in changes] for changes in report['changes']] == \
+        [['update'], ['update']]
+    assert not (tmp_path / "unused.sqlite").exists()
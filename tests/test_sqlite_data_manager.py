@@ -0,0 +1,140 @@
+from datetime import timedelta
+import pytest
+from flask import Flask
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+from ..datamanager.sqlite_data_manager import utcnow, PoolTimeoutError, SQLiteDataManager, User, UserMovieLibrary
+from .conftest import add_user_with_movie
+
+
+def test_row_reads_match_orm_reads(data_manager):
+    """The Core read path returns the same data as the ORM objects."""
+    user, movie = add_user_with_movie(data_manager, "alice", "The Matrix")
+    add_user_with_movie(data_manager, "bob", "Alien")
+
+    assert [row._asdict() for row in data_manager.get_all_user_rows()] == \
+        [u.to_dict() for u in data_manager.get_all_users()]
+    assert [row._asdict() for row in data_manager.get_user_movie_rows(user.id)] == \
+        [m.to_dict() for m in data_manager.get_user_movies(user.id)]
+
+    cards = data_manager.get_user_movie_cards(user.id)
+    assert [(c.id, c.title, c.year, c.poster) for c in cards] == \
+        [(movie.id, "The Matrix", "1999", "p.jpg")]
+
+
+def test_row_reads_reject_invalid_user_id(data_manager):
+    assert data_manager.get_user_movie_rows(0) == []
+    assert data_manager.get_user_movie_cards("1") == []
+
+
+def test_library_mutations_are_logged(data_manager):
+    """Each library mutation appends a change with an increasing sequence."""
+    user, movie = add_user_with_movie(data_manager, "alice", "The Matrix")
+    other_user, _ = add_user_with_movie(data_manager, "bob", "Alien")
+    start = data_manager.get_latest_change_seq()
+
+    relationship = data_manager.get_user_movie_relationship(user.id, movie.id)
+    relationship.notes = "Watch again"
+    data_manager.update_relationship(relationship)
+    data_manager.remove_movie_from_user(user.id, movie.id)
+
+    changes = data_manager.get_library_changes(user.id)
+    assert [change.op for change in changes] == ['insert', 'update', 'delete']
+    assert changes[0].title == "The Matrix"
+    assert [c.seq for c in changes] == sorted(c.seq for c in changes)
+    assert [c.op for c in data_manager.get_library_changes(user.id, since=start)] == \
+        ['update', 'delete']
+    assert [c.op for c in data_manager.get_library_changes(other_user.id)] == ['insert']
+
+
+def test_compaction_drops_superseded_changes(data_manager):
+    """Compaction keeps the latest change per entry and moves the horizon past old deletes."""
+    user, movie = add_user_with_movie(data_manager, "alice", "The Matrix")
+    _, kept = add_user_with_movie(data_manager, "alice2", "Alien")
+    data_manager.add_user_movie_relationship(UserMovieLibrary(user_id=user.id, movie_id=kept.id))
+    relationship = data_manager.get_user_movie_relationship(user.id, kept.id)
+    data_manager.update_relationship(relationship)
+    data_manager.remove_movie_from_user(user.id, movie.id)
+    last_delete = data_manager.get_library_changes(user.id)[-1].seq
+
+    assert data_manager.compact_library_changes(utcnow() + timedelta(minutes=1)) == 3
+    assert [(c.op, c.movie_id) for c in data_manager.get_library_changes(user.id)] == \
+        [('update', kept.id)]
+    assert data_manager.get_change_horizon() == last_delete
+
+
+@pytest.fixture
+def routed(sqlite_app):
+    manager = sqlite_app.extensions['data_manager']
+    with sqlite_app.app_context():
+        add_user_with_movie(manager, "alice", "The Matrix")
+    manager.init_read_routing(sqlite_app, pool_size=2)
+    yield sqlite_app, manager
+    manager.read_engine.dispose()
+
+
+def test_reads_use_read_only_pool_until_a_write(routed):
+    app, manager = routed
+    with app.test_request_context():
+        user = manager.get_user_by_id(1)
+        assert inspect(user).session is manager.read_sessions()
+        with pytest.raises(OperationalError):
+            manager.read_session().execute(text("DELETE FROM users"))
+
+        assert manager.add_user(User(name="bob"))
+        # Read-your-writes: the writer session sees the new user
+        assert manager.read_session() is manager.db.session
+        assert [u.name for u in manager.get_all_users()] == ["alice", "bob"]
+
+    with app.test_request_context():
+        assert manager.read_session() is manager.read_sessions()
+        with manager.db.engine.connect() as connection:
+            assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+
+
+def test_updates_merge_objects_read_from_reader_session(routed):
+    app, manager = routed
+    with app.test_request_context():
+        movie = manager.get_movie_by_id(1)
+        relationship = manager.get_user_movie_relationship(1, 1)
+        movie.title = "The Matrix Reloaded"
+        relationship.notes = "Sequel"
+        assert manager.update_movie(movie)
+        assert manager.update_relationship(relationship)
+
+    with app.test_request_context():
+        assert manager.get_movie_by_id(1).title == "The Matrix Reloaded"
+        assert manager.get_user_movie_relationship(1, 1).notes == "Sequel"
+        assert [c.op for c in manager.get_library_changes(1)] == ['insert', 'update', 'update']
+
+
+
+def test_exhausted_writer_pool_is_raised_not_swallowed(tmp_path):
+    db_path = tmp_path / "pool.sqlite"
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': 2, 'max_overflow': 0, 'pool_timeout': 0.1}
+    manager = SQLiteDataManager(str(db_path))
+    manager.db.init_app(app)
+    with app.app_context():
+        manager.migrate_schema()
+        manager.db.session.remove()
+        with manager.db.engine.connect(), manager.db.engine.connect():
+            # Every writer connection is taken, the write must not become a silent False
+            with pytest.raises(PoolTimeoutError):
+                manager.add_user(User(name="alice"))
+        assert manager.add_user(User(name="alice"))
+
+
+def test_exhausted_reader_pool_is_raised_not_swallowed(sqlite_app):
+    manager = sqlite_app.extensions['data_manager']
+    manager.init_read_routing(sqlite_app, pool_size=1, pool_timeout=0.1)
+    try:
+        with sqlite_app.app_context():
+            with manager.read_connection(), manager.read_connection():
+                with pytest.raises(PoolTimeoutError):
+                    manager.get_all_users()
+                with pytest.raises(PoolTimeoutError):
+                    manager.get_user_movie_cards(1)
+    finally:
+        manager.read_engine.dispose()
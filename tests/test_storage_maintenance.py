@@ -0,0 +1,75 @@
+from datetime import timedelta
+import pytest
+from ..datamanager.sqlite_data_manager import utcnow, Movie, User, UserMovieLibrary
+from ..metrics import get_metric, render_metrics, set_gauge
+from ..storage_maintenance import run_storage_maintenance
+
+
+class IdleActivity:
+    def is_idle(self, quiet_seconds):
+        return True
+
+
+@pytest.fixture
+def app(sqlite_app):
+    sqlite_app.config.update(STORAGE_IDLE_SECONDS=0, ORPHAN_GRACE_SECONDS=3600,
+                             ORPHAN_BATCH_SIZE=7, VACUUM_PAGES_PER_STEP=8)
+    return sqlite_app
+
+
+def add_orphans(manager):
+    user = User(name="alice")
+    manager.add_user(user)
+    old = utcnow() - timedelta(days=1)
+    kept = Movie(title="Kept", fetched_at=old)
+    manager.add_movie(kept)
+    manager.add_user_movie_relationship(UserMovieLibrary(user_id=user.id, movie_id=kept.id))
+    recent = Movie(title="Just added", fetched_at=utcnow())
+    manager.add_movie(recent)
+    manager.db.session.add_all([Movie(title="Orphan " + "x" * 2000, fetched_at=old)
+                                for i in range(50)])
+    manager.db.session.commit()
+
+
+def test_orphaned_movies_are_collected_and_file_shrinks(app, data_manager):
+    assert data_manager.enable_incremental_vacuum()
+    add_orphans(data_manager)
+
+    result = run_storage_maintenance(app, data_manager, IdleActivity())
+
+    assert result['deleted'] == 50
+    assert result['pages_freed'] > 0
+    assert {m.title for m in Movie.query.all()} == {"Kept", "Just added"}
+    stats = data_manager.get_storage_stats()
+    assert stats['freelist_count'] == 0
+    assert stats['tables']['movies']['rows'] == 2
+
+
+def test_maintenance_never_converts_the_database(app, data_manager):
+    """The full VACUUM needed to switch modes is left to startup."""
+    add_orphans(data_manager)
+
+    result = run_storage_maintenance(app, data_manager, IdleActivity())
+
+    assert result['deleted'] == 50 and result['pages_freed'] == 0
+    stats = data_manager.get_storage_stats()
+    assert stats['auto_vacuum'] == 0 and stats['freelist_count'] > 0
+
+
+def test_busy_app_skips_maintenance(app, data_manager):
+    class BusyActivity:
+        def is_idle(self, quiet_seconds):
+            return False
+
+    assert run_storage_maintenance(app, data_manager, BusyActivity()) is None
+
+
+def test_labeled_metrics_render_one_header_per_name():
+    set_gauge('test_table_rows', 2, "Rows per table", labels={'table': 'movies'})
+    set_gauge('test_table_rows', 1, "Rows per table", labels={'table': 'users'})
+
+    lines = render_metrics().splitlines()
+    assert lines.count("# TYPE test_table_rows gauge") == 1
+    assert 'test_table_rows{table="movies"} 2' in lines
+    assert 'test_table_rows{table="users"} 1' in lines
+    assert get_metric('test_table_rows', labels={'table': 'users'}) == 1